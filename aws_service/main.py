@@ -1,6 +1,9 @@
+import json
 import os
+from contextlib import asynccontextmanager
 from typing import Dict, Any
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 
 from .models import (
     DocumentCreateRequest, DocumentUpdateRequest, DocumentResponse,
@@ -10,13 +13,21 @@ from .dynamodb_service import DynamoDBService
 from .s3_service import S3Service
 from .rag_client import RAGClient
 
-app = FastAPI(title="AWS Service", version="1.0.0")
-
 dynamodb_service = DynamoDBService()
 s3_service = S3Service()
 rag_client = RAGClient()
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await rag_client.start()
+    yield
+    await rag_client.close()
+
+
+app = FastAPI(title="AWS Service", version="1.0.0", lifespan=lifespan)
+
+
 @app.post("/aws/documents", response_model=DocumentResponse)
 async def create_document(request: DocumentCreateRequest):
     try:
@@ -153,6 +164,45 @@ async def query_documents(request: QueryRequest):
         raise HTTPException(status_code=500, detail=f"Query error: {str(e)}")
 
 
+@app.post("/aws/query/stream")
+async def stream_query_documents(request: QueryRequest):
+    for doc_id in request.document_ids:
+        if not await dynamodb_service.document_exists(doc_id):
+            raise HTTPException(status_code=404, detail=f"Document {doc_id} not found")
+    
+    try:
+        response = await rag_client.open_query_stream(
+            document_ids=request.document_ids,
+            question=request.question
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if response.status_code >= 400:
+        body = await response.aread()
+        await response.aclose()
+        try:
+            detail = json.loads(body).get("detail", body.decode())
+        except ValueError:
+            detail = body.decode(errors="replace")
+        raise HTTPException(status_code=response.status_code, detail=detail)
+
+    # Relay the RAG module's events as they arrive instead of buffering the answer
+    async def relay():
+        try:
+            async for chunk in response.aiter_raw():
+                yield chunk
+        finally:
+            await response.aclose()
+
+    return StreamingResponse(relay(), media_type=response.headers.get("content-type", "application/x-ndjson"))
+
+
+@app.get("/aws/stats")
+async def get_stats():
+    return {"http": {"rag_module": rag_client.http.stats()}}
+
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "aws_service"}
@@ -1,22 +1,51 @@
+import asyncio
 import os
+import time
 import httpx
 from typing import Dict, Any
 
+from .http_pool import HTTPPool
+
 
 class RAGClient:
     def __init__(self):
         self.rag_service_url = os.getenv("RAG_SERVICE_URL", "http://rag_module:8001")
         self.timeout = float(os.getenv("RAG_SERVICE_TIMEOUT", "60.0"))
+        self.index_job_timeout = float(os.getenv("RAG_INDEX_JOB_TIMEOUT", "1800.0"))
+        self.index_poll_interval = float(os.getenv("RAG_INDEX_POLL_INTERVAL", "2.0"))
+        self.http = HTTPPool("rag_module", self.timeout)
+
+    async def start(self):
+        await self.http.start()
+
+    async def close(self):
+        await self.http.close()
 
     async def index_documents(self, document_ids: list[str]) -> Dict[str, Any]:
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.rag_service_url}/rag/index",
-                    json={"document_ids": document_ids}
-                )
-                response.raise_for_status()
-                return response.json()
+            response = await self.http.post(
+                f"{self.rag_service_url}/rag/index/jobs",
+                json={"document_ids": document_ids}
+            )
+            # RAG modules without background jobs index within the request
+            if response.status_code in (404, 405):
+                return await self._index_documents_inline(document_ids)
+            response.raise_for_status()
+            job = await self._wait_for_index_job(response.json())
+            return {
+                "job_id": job["job_id"],
+                "status": job["status"],
+                "results": [
+                    {
+                        "document_id": document["document_id"],
+                        "status": document["status"],
+                        "message": document.get("message") or job.get("error")
+                    }
+                    for document in job["documents"]
+                ]
+            }
+        except ValueError:
+            raise
         except httpx.TimeoutException:
             raise ValueError("RAG service timeout during indexing")
         except httpx.HTTPStatusError as e:
@@ -24,18 +53,36 @@ class RAGClient:
         except Exception as e:
             raise ValueError(f"Failed to communicate with RAG service: {str(e)}")
 
+    async def _wait_for_index_job(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        deadline = time.monotonic() + self.index_job_timeout
+        while job["status"] in ("queued", "running"):
+            if time.monotonic() > deadline:
+                raise ValueError(f"Indexing job {job['job_id']} is still {job['status']}, check it later")
+            await asyncio.sleep(self.index_poll_interval)
+            response = await self.http.get(f"{self.rag_service_url}/rag/index/jobs/{job['job_id']}")
+            response.raise_for_status()
+            job = response.json()
+        return job
+
+    async def _index_documents_inline(self, document_ids: list[str]) -> Dict[str, Any]:
+        response = await self.http.post(
+            f"{self.rag_service_url}/rag/index",
+            json={"document_ids": document_ids}
+        )
+        response.raise_for_status()
+        return response.json()
+
     async def query_documents(self, document_ids: list[str], question: str) -> Dict[str, Any]:
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.rag_service_url}/rag/query",
-                    json={
-                        "document_ids": document_ids,
-                        "question": question
-                    }
-                )
-                response.raise_for_status()
-                return response.json()
+            response = await self.http.post(
+                f"{self.rag_service_url}/rag/query",
+                json={
+                    "document_ids": document_ids,
+                    "question": question
+                }
+            )
+            response.raise_for_status()
+            return response.json()
         except httpx.TimeoutException:
             raise ValueError("RAG service timeout during query")
         except httpx.HTTPStatusError as e:
@@ -43,10 +90,24 @@ class RAGClient:
         except Exception as e:
             raise ValueError(f"Failed to communicate with RAG service: {str(e)}")
 
+    async def open_query_stream(self, document_ids: list[str], question: str) -> httpx.Response:
+        try:
+            return await self.http.open_stream(
+                "POST",
+                f"{self.rag_service_url}/rag/query/stream",
+                json={
+                    "document_ids": document_ids,
+                    "question": question
+                }
+            )
+        except httpx.TimeoutException:
+            raise ValueError("RAG service timeout during query")
+        except Exception as e:
+            raise ValueError(f"Failed to communicate with RAG service: {str(e)}")
+
     async def health_check(self) -> bool:
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(f"{self.rag_service_url}/health")
-                return response.status_code == 200
+            response = await self.http.get(f"{self.rag_service_url}/health", timeout=5.0)
+            return response.status_code == 200
         except:
             return False
\ No newline at end of file
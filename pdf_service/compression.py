@@ -0,0 +1,195 @@
+import gzip
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterator, List, Tuple, Union
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Framed text file layout:
+#   header  | MAGIC, codec id, raw block size
+#   blocks  | independently compressed blocks of block_size raw bytes (last may be shorter)
+#   index   | (compressed offset, compressed length, raw length) per block
+#   footer  | index offset, block count, total raw size, MAGIC
+MAGIC = b"PDFTXTZ1"
+HEADER = struct.Struct("<8sBI")
+INDEX_ENTRY = struct.Struct("<QII")
+FOOTER = struct.Struct("<QIQ8s")
+
+CODEC_IDS = {"gzip": 1, "zstd": 2}
+DEFAULT_BLOCK_SIZE = 256 * 1024
+
+
+def _require_zstd():
+    if zstandard is None:
+        raise ValueError("zstd compression requires the 'zstandard' package")
+
+
+def _compressor(codec_id: int) -> Callable[[bytes], bytes]:
+    if codec_id == CODEC_IDS["gzip"]:
+        return lambda data: gzip.compress(data, compresslevel=6, mtime=0)
+    if codec_id == CODEC_IDS["zstd"]:
+        _require_zstd()
+        return zstandard.ZstdCompressor(level=3).compress
+    raise ValueError(f"Unknown compression codec id: {codec_id}")
+
+
+def _decompressor(codec_id: int) -> Callable[[bytes], bytes]:
+    if codec_id == CODEC_IDS["gzip"]:
+        return gzip.decompress
+    if codec_id == CODEC_IDS["zstd"]:
+        _require_zstd()
+        return zstandard.ZstdDecompressor().decompress
+    raise ValueError(f"Unknown compression codec id: {codec_id}")
+
+
+def codec_id_for(codec: str) -> int:
+    if codec not in CODEC_IDS:
+        raise ValueError(f"Unknown compression codec: {codec}")
+    if codec == "zstd":
+        _require_zstd()
+    return CODEC_IDS[codec]
+
+
+class FramedTextWriter:
+    def __init__(self, path: Union[str, Path], codec: str, block_size: int = DEFAULT_BLOCK_SIZE):
+        self.codec_id = codec_id_for(codec)
+        self.block_size = block_size
+        self._compress = _compressor(self.codec_id)
+        self._file = open(path, 'wb')
+        self._file.write(HEADER.pack(MAGIC, self.codec_id, block_size))
+        self._buffer = bytearray()
+        self._index: List[Tuple[int, int, int]] = []
+        self.raw_size = 0
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        self.raw_size += len(data)
+        while len(self._buffer) >= self.block_size:
+            self._flush_block(bytes(self._buffer[:self.block_size]))
+            del self._buffer[:self.block_size]
+        return len(data)
+
+    def _flush_block(self, raw: bytes):
+        compressed = self._compress(raw)
+        self._index.append((self._file.tell(), len(compressed), len(raw)))
+        self._file.write(compressed)
+
+    def close(self):
+        if self._file.closed:
+            return
+        if self._buffer:
+            self._flush_block(bytes(self._buffer))
+            self._buffer.clear()
+        index_offset = self._file.tell()
+        for entry in self._index:
+            self._file.write(INDEX_ENTRY.pack(*entry))
+        self._file.write(FOOTER.pack(index_offset, len(self._index), self.raw_size, MAGIC))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self._file.close()
+        else:
+            self.close()
+
+
+class PlainTextReader:
+    def __init__(self, path: Union[str, Path]):
+        self._file = open(path, 'rb')
+        self.size = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+
+    def iter_range(self, start: int, end: int, chunk_size: int) -> Iterator[bytes]:
+        end = min(end, self.size)
+        for offset in range(start, end, chunk_size):
+            yield self._mmap[offset:min(offset + chunk_size, end)]
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+
+class FramedTextReader:
+    def __init__(self, path: Union[str, Path]):
+        self._file: BinaryIO = open(path, 'rb')
+        try:
+            magic, codec_id, self.block_size = HEADER.unpack(self._file.read(HEADER.size))
+            self._file.seek(-FOOTER.size, os.SEEK_END)
+            index_offset, block_count, self.size, trailer = FOOTER.unpack(self._file.read(FOOTER.size))
+            if magic != MAGIC or trailer != MAGIC:
+                raise ValueError(f"{path} is not a framed text file")
+            self._file.seek(index_offset)
+            raw_index = self._file.read(block_count * INDEX_ENTRY.size)
+            self._index = [entry for entry in INDEX_ENTRY.iter_unpack(raw_index)]
+            self._decompress = _decompressor(codec_id)
+        except BaseException:
+            self._file.close()
+            raise
+
+    def iter_range(self, start: int, end: int, chunk_size: int) -> Iterator[bytes]:
+        # Only the blocks overlapping [start, end) are read and decompressed
+        end = min(end, self.size)
+        if start >= end:
+            return
+        fd = self._file.fileno()
+        for block in range(start // self.block_size, (end - 1) // self.block_size + 1):
+            compressed_offset, compressed_length, _ = self._index[block]
+            raw = self._decompress(os.pread(fd, compressed_length, compressed_offset))
+            block_start = block * self.block_size
+            piece = raw[max(start - block_start, 0):end - block_start]
+            for offset in range(0, len(piece), chunk_size):
+                yield piece[offset:offset + chunk_size]
+
+    def close(self):
+        self._file.close()
+
+
+def open_text_writer(path: Union[str, Path], codec: str, block_size: int = DEFAULT_BLOCK_SIZE):
+    if codec == "none":
+        return open(path, 'wb')
+    return FramedTextWriter(path, codec, block_size)
+
+
+def open_text_reader(path: Union[str, Path]):
+    if Path(path).suffix == ".txtz":
+        return FramedTextReader(path)
+    return PlainTextReader(path)
+
+
+def negotiate_content_encoding(accept_encoding: str) -> str:
+    # Returns "zstd", "gzip" or "identity" based on the client's Accept-Encoding
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    
+    for encoding in ("zstd", "gzip"):
+        if encoding == "zstd" and zstandard is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return "identity"
+
+
+def encode_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        _require_zstd()
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6, mtime=0)
+    return body
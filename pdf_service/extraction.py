@@ -0,0 +1,80 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+from .pdf_processor import PDFProcessor, InvalidPDFError
+
+
+class ExtractionWorkerError(Exception):
+    pass
+
+
+class ExtractionEngine:
+    def __init__(self, max_workers: Optional[int] = None, pages_per_task: Optional[int] = None):
+        self.max_workers = max_workers or int(os.getenv("EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+        self.pages_per_task = pages_per_task or int(os.getenv("EXTRACTION_PAGES_PER_TASK", "50"))
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @staticmethod
+    def _create_executor(max_workers: int) -> ProcessPoolExecutor:
+        # Spawned workers avoid forking a process that is running an event loop
+        return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = self._create_executor(self.max_workers)
+        return self._executor
+
+    async def _run(self, executor: ProcessPoolExecutor, fn, *args):
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            # A worker died (crash or OOM kill); replace the pool so later documents still run
+            if self._executor is executor:
+                self._executor = None
+                executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    async def extract(self, pdf_path: Union[str, Path]) -> Tuple[List[str], int]:
+        path = str(pdf_path)
+        try:
+            return await self._extract(self.executor, path)
+        except BrokenProcessPool:
+            pass
+
+        # A dying worker fails every task in the pool, so retry once in a pool of its own:
+        # documents that were only running alongside the crash succeed, the culprit fails alone
+        isolated = self._create_executor(1)
+        try:
+            return await self._extract(isolated, path)
+        except BrokenProcessPool:
+            raise ExtractionWorkerError("Extraction worker crashed while processing the document")
+        finally:
+            isolated.shutdown(wait=False, cancel_futures=True)
+
+    async def _extract(self, executor: ProcessPoolExecutor, path: str) -> Tuple[List[str], int]:
+        page_count, pages = await self._run(executor, PDFProcessor.inspect_document, path, self.pages_per_task)
+        if page_count == 0:
+            raise InvalidPDFError("File is not a valid PDF")
+        if pages is not None:
+            return pages, page_count
+
+        ranges = [
+            (start, min(start + self.pages_per_task, page_count))
+            for start in range(0, page_count, self.pages_per_task)
+        ]
+        parts = await asyncio.gather(*[
+            self._run(executor, PDFProcessor.extract_page_range, path, start, end)
+            for start, end in ranges
+        ])
+        return [text for part in parts for text in part], page_count
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
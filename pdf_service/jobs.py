@@ -0,0 +1,153 @@
+import asyncio
+import os
+import uuid
+from typing import List, Optional
+
+from .extraction import ExtractionEngine, InvalidPDFError
+from .storage import DocumentStorage
+from .locks import FileLock
+
+
+class JobQueueFullError(Exception):
+    pass
+
+
+class ExtractionJobQueue:
+    def __init__(self, storage: DocumentStorage, engine: ExtractionEngine,
+                 workers: Optional[int] = None, max_pending: Optional[int] = None):
+        self.storage = storage
+        self.engine = engine
+        self.workers = workers or int(os.getenv("JOB_WORKERS", "2"))
+        self.max_pending = max_pending or int(os.getenv("JOB_QUEUE_SIZE", "1000"))
+        self.recovery_interval = float(os.getenv("JOB_RECOVERY_INTERVAL", "30"))
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # Every processing document is claimed by the worker process extracting it. A worker
+        # holds its liveness lock while running, so claims of a dead worker can be taken over
+        self.claims_dir = storage.storage_dir / "jobs"
+        self.claims_dir.mkdir(exist_ok=True)
+        self.worker_id = uuid.uuid4().hex
+        self._alive_lock = FileLock(self.claims_dir / f"{self.worker_id}.alive")
+        self._recovery_lock = FileLock(storage.storage_dir / "jobs.lock")
+
+    async def start(self):
+        self._alive_lock.acquire(blocking=False)
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        # Picks up jobs interrupted by a restart, and those of worker processes that died since
+        await self.recover()
+        self._tasks.append(asyncio.create_task(self._recover_periodically()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._alive_lock.held:
+            self._alive_lock.release()
+            self._alive_lock.path.unlink(missing_ok=True)
+
+    def _claim_path(self, doc_id: str):
+        return self.claims_dir / f"{doc_id}.claim"
+
+    def _owner(self, doc_id: str) -> Optional[str]:
+        try:
+            return self._claim_path(doc_id).read_text()
+        except FileNotFoundError:
+            return None
+
+    def _is_alive(self, worker_id: str) -> bool:
+        if worker_id == self.worker_id:
+            return True
+        alive_path = self.claims_dir / f"{worker_id}.alive"
+        if not alive_path.exists():
+            return False
+        lock = FileLock(alive_path)
+        if not lock.acquire(blocking=False):
+            return True
+        lock.release()
+        alive_path.unlink(missing_ok=True)
+        return False
+
+    def claim(self, doc_id: str, replace: bool = False) -> bool:
+        # Written aside and linked into place so a claim is never seen half-written
+        tmp_path = self.claims_dir / f"{doc_id}.{self.worker_id}.tmp"
+        tmp_path.write_text(self.worker_id)
+        try:
+            if replace:
+                os.replace(tmp_path, self._claim_path(doc_id))
+            else:
+                os.link(tmp_path, self._claim_path(doc_id))
+        except FileExistsError:
+            return self._owner(doc_id) == self.worker_id
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        return True
+
+    def release(self, doc_id: str):
+        if self._owner(doc_id) == self.worker_id:
+            self._claim_path(doc_id).unlink(missing_ok=True)
+
+    def _claim_orphaned(self) -> List[str]:
+        claimed = []
+        # Serialises takeovers between worker processes
+        with self._recovery_lock:
+            for metadata in self.storage.get_documents_by_status("processing"):
+                owner = self._owner(metadata.doc_id)
+                if owner is None:
+                    if self.claim(metadata.doc_id):
+                        claimed.append(metadata.doc_id)
+                elif not self._is_alive(owner):
+                    self.claim(metadata.doc_id, replace=True)
+                    claimed.append(metadata.doc_id)
+        return claimed
+
+    async def recover(self):
+        for doc_id in await asyncio.to_thread(self._claim_orphaned):
+            await self._queue.put(doc_id)
+
+    async def _recover_periodically(self):
+        while True:
+            await asyncio.sleep(self.recovery_interval)
+            try:
+                await self.recover()
+            except Exception as e:
+                print(f"Extraction job recovery failed: {str(e)}")
+
+    def submit(self, doc_id: str):
+        if self._queue.full():
+            raise JobQueueFullError("Extraction queue is full, retry later")
+        if not self.claim(doc_id):
+            # Another worker process already took the document over
+            return
+        self._queue.put_nowait(doc_id)
+
+    def pending_count(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _worker(self):
+        while True:
+            doc_id = await self._queue.get()
+            try:
+                await self._run(doc_id)
+            except Exception as e:
+                print(f"Extraction job {doc_id} failed unexpectedly: {str(e)}")
+            finally:
+                self.release(doc_id)
+                self._queue.task_done()
+
+    async def _run(self, doc_id: str):
+        pdf_path = self.storage.get_pdf_path(doc_id)
+        if pdf_path is None:
+            return
+        
+        try:
+            pages, page_count = await self.engine.extract(pdf_path)
+        except InvalidPDFError:
+            await asyncio.to_thread(self.storage.fail_document, doc_id, "File is not a valid PDF")
+            return
+        except Exception as e:
+            await asyncio.to_thread(self.storage.fail_document, doc_id, str(e))
+            return
+        
+        await asyncio.to_thread(self.storage.complete_document, doc_id, pages, page_count)
@@ -1,79 +1,377 @@
+import asyncio
+import hashlib
+import json
 import os
 import uuid
-from typing import List
-from fastapi import FastAPI, UploadFile, File, HTTPException, Query
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Iterator, List, Optional, Set, Tuple
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Header, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 
-from .models import DocumentResponse, DocumentListResponse, UploadResponse
-from .storage import DocumentStorage
-from .pdf_processor import PDFProcessor
-
-app = FastAPI(title="PDF Service", version="1.0.0")
+from .models import (
+    DocumentMetadata, DocumentResponse, DocumentBatchRequest, DocumentBatchRecord,
+    DocumentListResponse, UploadResponse, JobStatusResponse
+)
+from .storage import DocumentStorage, UploadTooLargeError, PAGE_SEPARATOR, encode_cursor
+from .extraction import ExtractionEngine
+from .pdf_processor import PDFProcessor, InvalidPDFError
+from .compression import encode_body, negotiate_content_encoding
+from .jobs import ExtractionJobQueue, JobQueueFullError
 
 storage = DocumentStorage(storage_dir=os.getenv("STORAGE_DIR", "uploads"))
-pdf_processor = PDFProcessor()
+extraction_engine = ExtractionEngine()
+job_queue = ExtractionJobQueue(storage, extraction_engine)
+upload_semaphore = asyncio.Semaphore(int(os.getenv("UPLOAD_CONCURRENCY", "4")))
 
 
-@app.post("/pdf/upload", response_model=List[UploadResponse])
-async def upload_pdfs(files: List[UploadFile] = File(...)):
-    if not files:
-        raise HTTPException(status_code=400, detail="No files provided")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await job_queue.start()
+    yield
+    await job_queue.stop()
+    extraction_engine.shutdown()
+
+
+app = FastAPI(title="PDF Service", version="1.0.0", lifespan=lifespan)
+
+
+async def ingest_file(file: UploadFile, defer_extraction: bool = False) -> UploadResponse:
+    if not file.filename.lower().endswith('.pdf'):
+        raise HTTPException(
+            status_code=400, 
+            detail=f"File {file.filename} is not a PDF"
+        )
     
-    results = []
+    try:
+        staged_path, _, content_hash = await storage.stage_upload(file)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=f"File {file.filename}: {str(e)}")
     
-    for file in files:
-        if not file.filename.lower().endswith('.pdf'):
-            raise HTTPException(
-                status_code=400, 
-                detail=f"File {file.filename} is not a PDF"
-            )
+    try:
+        doc_id = str(uuid.uuid4())
         
-        content = await file.read()
+        existing = storage.find_existing_content(content_hash)
+        if existing is not None:
+            metadata = await run_in_threadpool(storage.save_duplicate, doc_id=doc_id, filename=file.filename, existing=existing)
+            if metadata is not None:
+                return UploadResponse(
+                    doc_id=metadata.doc_id,
+                    filename=metadata.filename,
+                    upload_timestamp=metadata.upload_timestamp,
+                    file_size=metadata.file_size,
+                    page_count=metadata.page_count,
+                    deduplicated=True
+                )
         
-        if not pdf_processor.is_valid_pdf(content):
+        if defer_extraction:
+            # Claimed before it shows up as processing, so job recovery in other workers skips it
+            job_queue.claim(doc_id)
+            try:
+                metadata = await run_in_threadpool(
+                    storage.save_pending,
+                    doc_id=doc_id,
+                    filename=file.filename,
+                    staged_path=staged_path,
+                    content_hash=content_hash
+                )
+                job_queue.submit(doc_id)
+            except JobQueueFullError as e:
+                await run_in_threadpool(storage.delete_document, doc_id)
+                job_queue.release(doc_id)
+                raise HTTPException(status_code=503, detail=str(e))
+            except BaseException:
+                job_queue.release(doc_id)
+                raise
+            
+            return UploadResponse(
+                doc_id=metadata.doc_id,
+                filename=metadata.filename,
+                upload_timestamp=metadata.upload_timestamp,
+                file_size=metadata.file_size,
+                status="pending"
+            )
+        
+        try:
+            pages, page_count = await extraction_engine.extract(staged_path)
+        except InvalidPDFError:
             raise HTTPException(
                 status_code=400, 
                 detail=f"File {file.filename} is not a valid PDF"
             )
         
+        # Compressing and writing a large text takes long enough to stall the event loop
+        metadata = await run_in_threadpool(
+            storage.save_document,
+            doc_id=doc_id,
+            filename=file.filename,
+            staged_path=staged_path,
+            content_hash=content_hash,
+            pages=pages,
+            page_count=page_count
+        )
+        
+        return UploadResponse(
+            doc_id=metadata.doc_id,
+            filename=metadata.filename,
+            upload_timestamp=metadata.upload_timestamp,
+            file_size=metadata.file_size,
+            page_count=metadata.page_count
+        )
+        
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    finally:
+        storage.discard_staged(staged_path)
+
+
+async def ingest_file_in_batch(file: UploadFile, defer_extraction: bool) -> UploadResponse:
+    async with upload_semaphore:
         try:
-            extracted_text, page_count = pdf_processor.extract_text_and_metadata(content)
-            doc_id = str(uuid.uuid4())
-            
-            metadata = storage.save_document(
-                doc_id=doc_id,
+            return await ingest_file(file, defer_extraction)
+        except HTTPException as e:
+            return UploadResponse(
                 filename=file.filename,
-                content=content,
-                extracted_text=extracted_text,
-                page_count=page_count
+                status="failed",
+                error=e.detail
             )
-            
-            results.append(UploadResponse(
-                doc_id=metadata.doc_id,
-                filename=metadata.filename,
-                upload_timestamp=metadata.upload_timestamp,
-                file_size=metadata.file_size,
-                page_count=metadata.page_count
-            ))
-            
-        except ValueError as e:
-            raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+            # e.g. an OSError from staging; one file's failure must not fail the whole batch
+            return UploadResponse(
+                filename=file.filename,
+                status="failed",
+                error=f"Internal server error: {str(e)}"
+            )
+
+
+@app.post("/pdf/upload", response_model=List[UploadResponse])
+async def upload_pdfs(
+    response: Response,
+    files: List[UploadFile] = File(...),
+    batch: bool = Query(False, description="Process files concurrently and report per-file status"),
+    async_processing: bool = Query(False, description="Store the PDF and extract text in the background")
+):
+    if not files:
+        raise HTTPException(status_code=400, detail="No files provided")
+    
+    if async_processing:
+        response.status_code = 202
+    
+    if batch:
+        return await asyncio.gather(*[ingest_file_in_batch(file, async_processing) for file in files])
+    
+    results = []
+    for file in files:
+        results.append(await ingest_file(file, async_processing))
     
     return results
 
 
-@app.get("/pdf/documents/{doc_id}", response_model=DocumentResponse)
-async def get_document(doc_id: str):
+def ndjson_line(record: dict) -> str:
+    return json.dumps(record, default=str) + "\n"
+
+
+def stream_stored_pages(metadata: DocumentMetadata) -> Iterator[str]:
+    yield ndjson_line({"doc_id": metadata.doc_id, "filename": metadata.filename, "status": "processing"})
+    start_char = 0
+    for page_number, page_text in enumerate(storage.iter_pages(metadata.doc_id), start=1):
+        if page_number > 1:
+            start_char += len(PAGE_SEPARATOR)
+        end_char = start_char + len(page_text)
+        yield ndjson_line({"page": page_number, "text": page_text, "start_char": start_char, "end_char": end_char})
+        start_char = end_char
+    yield ndjson_line({
+        "doc_id": metadata.doc_id,
+        "status": "ready",
+        "page_count": metadata.page_count,
+        "text_length": metadata.text_length,
+        "deduplicated": True
+    })
+
+
+async def stream_extracted_pages(metadata: DocumentMetadata) -> AsyncIterator[str]:
+    doc_id = metadata.doc_id
+    yield ndjson_line({"doc_id": doc_id, "filename": metadata.filename, "status": "processing"})
+    
+    pages = PDFProcessor.iter_page_texts(storage.get_pdf_path(doc_id))
+    writer = storage.open_text_blob(metadata.content_hash)
+    # PyMuPDF documents must stay on one thread; extraction and the incremental write share it
+    executor = ThreadPoolExecutor(max_workers=1)
+    loop = asyncio.get_running_loop()
+    finished = False
+
+    def next_page() -> Optional[Tuple[str, Tuple[int, int]]]:
+        page_text = next(pages, None)
+        if page_text is None:
+            return None
+        return page_text, writer.add_page(page_text)
+
+    try:
+        page_number = 0
+        while True:
+            step = await loop.run_in_executor(executor, next_page)
+            if step is None:
+                break
+            page_number += 1
+            page_text, (start_char, end_char) = step
+            yield ndjson_line({"page": page_number, "text": page_text, "start_char": start_char, "end_char": end_char})
+        
+        completed = await run_in_threadpool(storage.complete_streamed_document, doc_id, writer)
+        job_queue.release(doc_id)
+        finished = True
+        yield ndjson_line({
+            "doc_id": doc_id,
+            "status": "ready" if completed else "deleted",
+            "page_count": page_number,
+            "text_length": writer.text_length
+        })
+    except Exception as e:
+        writer.abort()
+        error = "File is not a valid PDF" if isinstance(e, InvalidPDFError) else str(e)
+        await run_in_threadpool(storage.fail_document, doc_id, error)
+        job_queue.release(doc_id)
+        finished = True
+        yield ndjson_line({"doc_id": doc_id, "status": "failed", "error": error})
+    finally:
+        if not finished:
+            # The client went away mid-stream; let a background job finish the document
+            writer.abort()
+            try:
+                job_queue.submit(doc_id)
+            except JobQueueFullError as e:
+                await run_in_threadpool(storage.fail_document, doc_id, str(e))
+                job_queue.release(doc_id)
+        executor.submit(pages.close)
+        executor.shutdown(wait=False)
+
+
+@app.post("/pdf/upload/stream")
+async def upload_pdf_streaming(file: UploadFile = File(...)):
+    if not file.filename.lower().endswith('.pdf'):
+        raise HTTPException(
+            status_code=400, 
+            detail=f"File {file.filename} is not a PDF"
+        )
+    
+    try:
+        staged_path, _, content_hash = await storage.stage_upload(file)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=f"File {file.filename}: {str(e)}")
+    
+    try:
+        doc_id = str(uuid.uuid4())
+        
+        existing = storage.find_existing_content(content_hash)
+        if existing is not None:
+            metadata = await run_in_threadpool(storage.save_duplicate, doc_id=doc_id, filename=file.filename, existing=existing)
+            if metadata is not None:
+                return StreamingResponse(stream_stored_pages(metadata), media_type="application/x-ndjson")
+        
+        # This worker extracts the document itself; the claim keeps job recovery off it
+        job_queue.claim(doc_id)
+        try:
+            metadata = await run_in_threadpool(
+                storage.save_pending,
+                doc_id=doc_id,
+                filename=file.filename,
+                staged_path=staged_path,
+                content_hash=content_hash
+            )
+        except BaseException:
+            job_queue.release(doc_id)
+            raise
+    finally:
+        storage.discard_staged(staged_path)
+    
+    return StreamingResponse(stream_extracted_pages(metadata), media_type="application/x-ndjson")
+
+
+@app.get("/pdf/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job_status(job_id: str):
+    metadata = storage.get_document_metadata(job_id)
+    if not metadata:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return JobStatusResponse(
+        job_id=metadata.doc_id,
+        doc_id=metadata.doc_id,
+        filename=metadata.filename,
+        status=metadata.status,
+        page_count=metadata.page_count,
+        text_length=metadata.text_length,
+        error=metadata.error
+    )
+
+
+def get_ready_document(doc_id: str) -> DocumentMetadata:
     metadata = storage.get_document_metadata(doc_id)
     if not metadata:
         raise HTTPException(status_code=404, detail="Document not found")
+    if metadata.status != "ready":
+        raise HTTPException(
+            status_code=409,
+            detail=f"Document is {metadata.status}" + (f": {metadata.error}" if metadata.error else "")
+        )
+    return metadata
+
+
+DOCUMENT_FIELDS = set(DocumentResponse.model_fields)
+COMPRESSION_MIN_SIZE = int(os.getenv("RESPONSE_COMPRESSION_MIN_SIZE", "1024"))
+
+
+def document_etag(metadata: DocumentMetadata, fields: Optional[Set[str]] = None) -> str:
+    # Documents are immutable once ready, so the content hash identifies the content.
+    # The tag is weak because the gzip, zstd and identity bodies all share it
+    tag = metadata.content_hash or f"{metadata.doc_id}-{metadata.text_length}"
+    if fields is not None and fields != DOCUMENT_FIELDS:
+        tag += "-" + hashlib.sha256(",".join(sorted(fields)).encode()).hexdigest()[:12]
+    return f'W/"{tag}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    bare = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == bare for candidate in if_none_match.split(","))
+
+
+def parse_fields(fields: Optional[str]) -> Set[str]:
+    if fields is None:
+        return set(DOCUMENT_FIELDS)
+    selected = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = selected - DOCUMENT_FIELDS
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return selected
+
+
+@app.get("/pdf/documents/{doc_id}", response_model=DocumentResponse)
+async def get_document(
+    doc_id: str,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. doc_id,filename,page_count"),
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None)
+):
+    metadata = get_ready_document(doc_id)
+    selected = parse_fields(fields)
     
-    extracted_text = storage.get_document_text(doc_id)
-    if extracted_text is None:
-        raise HTTPException(status_code=500, detail="Document text not found")
+    headers = {"ETag": document_etag(metadata, None if fields is None else selected), "Vary": "Accept-Encoding"}
+    if if_none_match and etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    
+    extracted_text = None
+    if "extracted_text" in selected:
+        # Reading and decompressing a large text would stall the event loop
+        extracted_text = await run_in_threadpool(storage.get_document_text, doc_id)
+        if extracted_text is None:
+            raise HTTPException(status_code=500, detail="Document text not found")
     
-    return DocumentResponse(
+    body = DocumentResponse(
         doc_id=metadata.doc_id,
         filename=metadata.filename,
         upload_timestamp=metadata.upload_timestamp,
@@ -81,15 +379,152 @@ async def get_document(doc_id: str):
         page_count=metadata.page_count,
         text_length=metadata.text_length,
         extracted_text=extracted_text
+    ).model_dump_json(include=selected).encode()
+    
+    encoding = negotiate_content_encoding(accept_encoding)
+    if encoding != "identity" and len(body) >= COMPRESSION_MIN_SIZE:
+        body = await run_in_threadpool(encode_body, body, encoding)
+        headers["Content-Encoding"] = encoding
+    
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def iter_document_batch(request: DocumentBatchRequest) -> Iterator[str]:
+    for doc_id in request.doc_ids:
+        metadata = storage.get_document_metadata(doc_id)
+        if not metadata:
+            record = DocumentBatchRecord(doc_id=doc_id, status="not_found")
+        elif metadata.status != "ready":
+            record = DocumentBatchRecord(doc_id=doc_id, status=metadata.status, error=metadata.error)
+        else:
+            record = DocumentBatchRecord(
+                doc_id=metadata.doc_id,
+                status="ready",
+                filename=metadata.filename,
+                upload_timestamp=metadata.upload_timestamp,
+                file_size=metadata.file_size,
+                page_count=metadata.page_count,
+                text_length=metadata.text_length
+            )
+            record.etag = document_etag(metadata)
+            if request.if_none_match.get(doc_id) and etag_matches(request.if_none_match[doc_id], record.etag):
+                record.status = "not_modified"
+            elif request.include_text:
+                record.extracted_text = storage.get_document_text(doc_id)
+                if record.extracted_text is None:
+                    record.status = "failed"
+                    record.error = "Document text not found"
+        yield record.model_dump_json(exclude_none=True) + "\n"
+
+
+@app.post("/pdf/documents/batch")
+async def get_documents_batch(request: DocumentBatchRequest):
+    # One NDJSON line per requested document, in request order
+    return StreamingResponse(iter_document_batch(request), media_type="application/x-ndjson")
+
+
+@app.delete("/pdf/documents/{doc_id}")
+async def delete_document(doc_id: str):
+    if not await run_in_threadpool(storage.delete_document, doc_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    return {"status": "deleted", "doc_id": doc_id}
+
+
+def parse_page_range(pages: str, page_count: int) -> Tuple[int, int]:
+    try:
+        first, _, last = pages.partition("-")
+        start = int(first)
+        end = int(last) if last else start
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid page range: {pages}")
+    
+    if start < 1 or end < start or end > page_count:
+        raise HTTPException(
+            status_code=416,
+            detail=f"Page range {pages} is outside 1-{page_count}"
+        )
+    return start, end
+
+
+def parse_byte_range(range_header: str, size: int) -> Tuple[int, int]:
+    unit, _, spec = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        raise HTTPException(status_code=416, detail="Only a single bytes range is supported")
+    
+    try:
+        first, _, last = spec.strip().partition("-")
+        if not first:
+            start, end = max(size - int(last), 0), size
+        else:
+            start = int(first)
+            end = min(int(last) + 1, size) if last else size
+    except ValueError:
+        raise HTTPException(status_code=416, detail=f"Invalid range: {range_header}")
+    
+    if start >= size or end <= start:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+
+@app.get("/pdf/documents/{doc_id}/text")
+async def get_document_text(
+    doc_id: str,
+    pages: Optional[str] = Query(None, description="1-based page or inclusive page range, e.g. 3 or 2-5"),
+    range_header: Optional[str] = Header(None, alias="Range")
+):
+    get_ready_document(doc_id)
+    
+    text_size = storage.get_text_size(doc_id)
+    if text_size is None:
+        raise HTTPException(status_code=500, detail="Document text not found")
+    
+    start, end = 0, text_size
+    if pages is not None:
+        page_offsets = storage.get_page_offsets(doc_id)
+        if page_offsets is None:
+            raise HTTPException(status_code=404, detail="Page index not available for this document")
+        first_page, last_page = parse_page_range(pages, len(page_offsets))
+        start, end = page_offsets[first_page - 1][0], page_offsets[last_page - 1][1]
+    
+    status_code = 200
+    headers = {"Accept-Ranges": "bytes"}
+    if range_header:
+        # Byte ranges apply to the selected pages, not the whole file
+        range_start, range_end = parse_byte_range(range_header, end - start)
+        headers["Content-Range"] = f"bytes {range_start}-{range_end - 1}/{end - start}"
+        start, end = start + range_start, start + range_end
+        status_code = 206
+    headers["Content-Length"] = str(end - start)
+    
+    return StreamingResponse(
+        storage.iter_text_range(doc_id, start, end),
+        status_code=status_code,
+        media_type="text/plain; charset=utf-8",
+        headers=headers
     )
 
 
 @app.get("/pdf/documents", response_model=DocumentListResponse)
 async def list_documents(
     page: int = Query(1, ge=1, description="Page number"),
-    limit: int = Query(10, ge=1, le=100, description="Items per page")
+    limit: int = Query(10, ge=1, le=100, description="Items per page"),
+    cursor: Optional[str] = Query(None, description="Opaque next_cursor from a previous page; overrides page")
 ):
-    documents, total = storage.get_all_documents(page=page, limit=limit)
+    if cursor is not None:
+        try:
+            documents, next_cursor = storage.list_documents_page(cursor=cursor, limit=limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        total = storage.count_documents()
+    else:
+        documents, total = storage.get_all_documents(page=page, limit=limit)
+        next_cursor = encode_cursor(documents[-1]) if documents and page * limit < total else None
+    
     total_pages = (total + limit - 1) // limit
     
     return DocumentListResponse(
@@ -97,10 +532,19 @@ async def list_documents(
         total=total,
         page=page,
         limit=limit,
-        total_pages=total_pages
+        total_pages=total_pages,
+        next_cursor=next_cursor
     )
 
 
+@app.get("/pdf/stats")
+async def get_stats():
+    return {
+        "text_cache": storage.text_cache.stats(),
+        "pending_jobs": job_queue.pending_count()
+    }
+
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "pdf_service"}
@@ -108,4 +552,9 @@ async def health_check():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(
+        "pdf_service.main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=int(os.getenv("UVICORN_WORKERS", "1"))
+    )
\ No newline at end of file
@@ -0,0 +1,334 @@
+import bisect
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from .models import DocumentMetadata
+from .locks import FileLock
+
+# Documents are listed newest first; doc_id breaks ties between equal timestamps
+UploadOrderKey = Tuple[str, str]
+
+
+def upload_order_key(metadata: DocumentMetadata) -> UploadOrderKey:
+    return metadata.upload_timestamp.isoformat(timespec="microseconds"), metadata.doc_id
+
+
+class MetadataStore:
+    def get(self, doc_id: str) -> Optional[DocumentMetadata]:
+        raise NotImplementedError
+
+    def put(self, metadata: DocumentMetadata):
+        raise NotImplementedError
+
+    def delete(self, doc_id: str) -> bool:
+        raise NotImplementedError
+
+    def list_documents(self, offset: int, limit: int) -> List[DocumentMetadata]:
+        raise NotImplementedError
+
+    def list_documents_before(self, key: Optional[UploadOrderKey], limit: int) -> List[DocumentMetadata]:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def find_by_content_hash(self, content_hash: str) -> Optional[DocumentMetadata]:
+        raise NotImplementedError
+
+    def count_references(self, content_hash: str) -> int:
+        raise NotImplementedError
+
+    def find_by_status(self, status: str) -> List[DocumentMetadata]:
+        raise NotImplementedError
+
+    def exists(self, doc_id: str) -> bool:
+        return self.get(doc_id) is not None
+
+
+class JSONMetadataStore(MetadataStore):
+    def __init__(self, metadata_file: Path):
+        self.metadata_file = metadata_file
+        # Other workers may rewrite the file; writes are serialised by this lock and
+        # every access reloads the catalog if the file on disk has changed
+        self._lock = FileLock(metadata_file.with_suffix(".json.lock"))
+        self._loaded_version = None
+        self._load_metadata()
+
+    @staticmethod
+    def _file_version(stat: os.stat_result) -> tuple:
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _refresh(self):
+        try:
+            version = self._file_version(self.metadata_file.stat())
+        except FileNotFoundError:
+            version = None
+        if version != self._loaded_version:
+            self._load_metadata()
+
+    def _load_metadata(self):
+        try:
+            with open(self.metadata_file, 'r') as f:
+                self._loaded_version = self._file_version(os.fstat(f.fileno()))
+                data = json.load(f)
+                self.metadata = {
+                    doc_id: DocumentMetadata(**meta) 
+                    for doc_id, meta in data.items()
+                }
+        except FileNotFoundError:
+            self._loaded_version = None
+            self.metadata = {}
+        self.order = sorted(upload_order_key(meta) for meta in self.metadata.values())
+        self.content_refs: Dict[str, Set[str]] = {}
+        for meta in self.metadata.values():
+            self._add_content_ref(meta)
+
+    def _save_metadata(self):
+        data = {
+            doc_id: meta.model_dump(mode='json')
+            for doc_id, meta in self.metadata.items()
+        }
+        # Write to a sibling file and rename so a crash never leaves a truncated catalog
+        tmp_file = self.metadata_file.with_suffix(".json.tmp")
+        with open(tmp_file, 'w') as f:
+            json.dump(data, f, default=str)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.metadata_file)
+        self._loaded_version = self._file_version(self.metadata_file.stat())
+
+    def get(self, doc_id: str) -> Optional[DocumentMetadata]:
+        self._refresh()
+        return self.metadata.get(doc_id)
+
+    def put(self, metadata: DocumentMetadata):
+        with self._lock:
+            self._refresh()
+            previous = self.metadata.get(metadata.doc_id)
+            if previous is not None:
+                self._remove_order_key(upload_order_key(previous))
+                self._remove_content_ref(previous)
+            self.metadata[metadata.doc_id] = metadata
+            bisect.insort(self.order, upload_order_key(metadata))
+            self._add_content_ref(metadata)
+            self._save_metadata()
+
+    def delete(self, doc_id: str) -> bool:
+        with self._lock:
+            self._refresh()
+            previous = self.metadata.pop(doc_id, None)
+            if previous is None:
+                return False
+            self._remove_order_key(upload_order_key(previous))
+            self._remove_content_ref(previous)
+            self._save_metadata()
+        return True
+
+    def _add_content_ref(self, metadata: DocumentMetadata):
+        if metadata.content_hash:
+            self.content_refs.setdefault(metadata.content_hash, set()).add(metadata.doc_id)
+
+    def _remove_content_ref(self, metadata: DocumentMetadata):
+        refs = self.content_refs.get(metadata.content_hash or "")
+        if refs is not None:
+            refs.discard(metadata.doc_id)
+            if not refs:
+                del self.content_refs[metadata.content_hash]
+
+    def find_by_content_hash(self, content_hash: str) -> Optional[DocumentMetadata]:
+        self._refresh()
+        refs = self.content_refs.get(content_hash)
+        return self.metadata[next(iter(refs))] if refs else None
+
+    def count_references(self, content_hash: str) -> int:
+        self._refresh()
+        return len(self.content_refs.get(content_hash, ()))
+
+    def find_by_status(self, status: str) -> List[DocumentMetadata]:
+        self._refresh()
+        return [meta for meta in self.metadata.values() if meta.status == status]
+
+    def _remove_order_key(self, key: UploadOrderKey):
+        idx = bisect.bisect_left(self.order, key)
+        if idx < len(self.order) and self.order[idx] == key:
+            del self.order[idx]
+
+    def _collect_newest_first(self, end: int, limit: int) -> List[DocumentMetadata]:
+        keys = self.order[max(end - limit, 0):end]
+        return [self.metadata[doc_id] for _, doc_id in reversed(keys)]
+
+    def list_documents(self, offset: int, limit: int) -> List[DocumentMetadata]:
+        self._refresh()
+        return self._collect_newest_first(len(self.order) - offset, limit) if offset < len(self.order) else []
+
+    def list_documents_before(self, key: Optional[UploadOrderKey], limit: int) -> List[DocumentMetadata]:
+        self._refresh()
+        end = len(self.order) if key is None else bisect.bisect_left(self.order, key)
+        return self._collect_newest_first(end, limit)
+
+    def count(self) -> int:
+        self._refresh()
+        return len(self.metadata)
+
+    def exists(self, doc_id: str) -> bool:
+        self._refresh()
+        return doc_id in self.metadata
+
+
+class SQLiteMetadataStore(MetadataStore):
+    def __init__(self, db_file: Path, legacy_json_file: Optional[Path] = None):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        # Each worker process has its own connection; wait for other writers instead of failing
+        self.conn.execute(f"PRAGMA busy_timeout={int(os.getenv('METADATA_BUSY_TIMEOUT_MS', '5000'))}")
+        with FileLock(db_file.with_suffix(".db.lock")):
+            self._ensure_schema()
+            if legacy_json_file is not None and legacy_json_file.exists():
+                self._migrate_from_json(legacy_json_file)
+
+    def _ensure_schema(self):
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS documents (
+                doc_id TEXT PRIMARY KEY,
+                upload_timestamp TEXT NOT NULL,
+                data TEXT NOT NULL,
+                content_hash TEXT,
+                status TEXT
+            )"""
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(documents)")}
+        if "content_hash" not in columns:
+            self.conn.execute("ALTER TABLE documents ADD COLUMN content_hash TEXT")
+        if "status" not in columns:
+            self.conn.execute("ALTER TABLE documents ADD COLUMN status TEXT")
+            self.conn.execute(
+                "UPDATE documents SET status = COALESCE(json_extract(data, '$.status'), 'ready')"
+            )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_documents_content_hash "
+            "ON documents (content_hash)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_documents_status "
+            "ON documents (status)"
+        )
+        self.conn.execute("DROP INDEX IF EXISTS idx_documents_upload_timestamp")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_documents_upload_order "
+            "ON documents (upload_timestamp, doc_id)"
+        )
+
+    def _migrate_from_json(self, json_file: Path):
+        with open(json_file, 'r') as f:
+            data = json.load(f)
+        rows = [self._to_row(DocumentMetadata(**meta)) for meta in data.values()]
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO documents (doc_id, upload_timestamp, data, content_hash, status) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        os.replace(json_file, json_file.with_suffix(".json.migrated"))
+        print(f"Migrated {len(rows)} documents from {json_file} to {self.db_file}")
+
+    @staticmethod
+    def _to_row(metadata: DocumentMetadata) -> tuple:
+        upload_timestamp, doc_id = upload_order_key(metadata)
+        return doc_id, upload_timestamp, metadata.model_dump_json(), metadata.content_hash, metadata.status
+
+    def get(self, doc_id: str) -> Optional[DocumentMetadata]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT data FROM documents WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+        return DocumentMetadata.model_validate_json(row[0]) if row else None
+
+    def put(self, metadata: DocumentMetadata):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO documents (doc_id, upload_timestamp, data, content_hash, status) "
+                "VALUES (?, ?, ?, ?, ?)",
+                self._to_row(metadata)
+            )
+
+    def delete(self, doc_id: str) -> bool:
+        with self._lock:
+            cursor = self.conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+        return cursor.rowcount > 0
+
+    def list_documents(self, offset: int, limit: int) -> List[DocumentMetadata]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT data FROM documents ORDER BY upload_timestamp DESC, doc_id DESC LIMIT ? OFFSET ?",
+                (limit, offset)
+            ).fetchall()
+        return [DocumentMetadata.model_validate_json(row[0]) for row in rows]
+
+    def list_documents_before(self, key: Optional[UploadOrderKey], limit: int) -> List[DocumentMetadata]:
+        with self._lock:
+            if key is None:
+                rows = self.conn.execute(
+                    "SELECT data FROM documents ORDER BY upload_timestamp DESC, doc_id DESC LIMIT ?",
+                    (limit,)
+                ).fetchall()
+            else:
+                rows = self.conn.execute(
+                    "SELECT data FROM documents WHERE (upload_timestamp, doc_id) < (?, ?) "
+                    "ORDER BY upload_timestamp DESC, doc_id DESC LIMIT ?",
+                    (*key, limit)
+                ).fetchall()
+        return [DocumentMetadata.model_validate_json(row[0]) for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def find_by_content_hash(self, content_hash: str) -> Optional[DocumentMetadata]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT data FROM documents WHERE content_hash = ? LIMIT 1", (content_hash,)
+            ).fetchone()
+        return DocumentMetadata.model_validate_json(row[0]) if row else None
+
+    def count_references(self, content_hash: str) -> int:
+        with self._lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM documents WHERE content_hash = ?", (content_hash,)
+            ).fetchone()[0]
+
+    def find_by_status(self, status: str) -> List[DocumentMetadata]:
+        # Polled by job recovery in every worker, so it goes through the status index
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT data FROM documents WHERE status = ?", (status,)
+            ).fetchall()
+        return [DocumentMetadata.model_validate_json(row[0]) for row in rows]
+
+    def exists(self, doc_id: str) -> bool:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM documents WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+        return row is not None
+
+
+def create_metadata_store(backend: str, storage_dir: Path) -> MetadataStore:
+    json_file = storage_dir / "metadata.json"
+    if backend == "json":
+        return JSONMetadataStore(json_file)
+    if backend == "sqlite":
+        return SQLiteMetadataStore(storage_dir / "metadata.db", legacy_json_file=json_file)
+    raise ValueError(f"Unknown metadata backend: {backend}")
@@ -1,6 +1,6 @@
 from datetime import datetime
-from typing import Optional
-from pydantic import BaseModel
+from typing import Dict, Optional
+from pydantic import BaseModel, Field
 
 
 class DocumentMetadata(BaseModel):
@@ -10,6 +10,9 @@ class DocumentMetadata(BaseModel):
     file_size: int
     page_count: Optional[int] = None
     text_length: Optional[int] = None
+    content_hash: Optional[str] = None
+    status: str = "ready"
+    error: Optional[str] = None
 
 
 class DocumentResponse(BaseModel):
@@ -19,7 +22,29 @@ class DocumentResponse(BaseModel):
     file_size: int
     page_count: Optional[int] = None
     text_length: Optional[int] = None
-    extracted_text: str
+    extracted_text: Optional[str] = None
+
+
+class DocumentBatchRequest(BaseModel):
+    doc_ids: list[str] = Field(..., max_length=1000, description="Document IDs to fetch")
+    include_text: bool = Field(True, description="Set to false to return metadata only")
+    if_none_match: Dict[str, str] = Field(
+        default_factory=dict,
+        description="ETags the caller already holds, keyed by document ID; matching documents are returned without text"
+    )
+
+
+class DocumentBatchRecord(BaseModel):
+    doc_id: str
+    status: str
+    filename: Optional[str] = None
+    upload_timestamp: Optional[datetime] = None
+    file_size: Optional[int] = None
+    page_count: Optional[int] = None
+    text_length: Optional[int] = None
+    extracted_text: Optional[str] = None
+    etag: Optional[str] = None
+    error: Optional[str] = None
 
 
 class DocumentListResponse(BaseModel):
@@ -28,12 +53,25 @@ class DocumentListResponse(BaseModel):
     page: int
     limit: int
     total_pages: int
+    next_cursor: Optional[str] = None
 
 
 class UploadResponse(BaseModel):
+    doc_id: Optional[str] = None
+    filename: str
+    upload_timestamp: Optional[datetime] = None
+    file_size: Optional[int] = None
+    page_count: Optional[int] = None
+    status: str = "success"
+    deduplicated: bool = False
+    error: Optional[str] = None
+
+
+class JobStatusResponse(BaseModel):
+    job_id: str
     doc_id: str
     filename: str
-    upload_timestamp: datetime
-    file_size: int
+    status: str
     page_count: Optional[int] = None
-    status: str = "success"
\ No newline at end of file
+    text_length: Optional[int] = None
+    error: Optional[str] = None
@@ -1,31 +1,48 @@
-import io
-from typing import Tuple, Optional
+from pathlib import Path
+from typing import Iterator, List, Tuple, Optional, Union
 import pymupdf
 
 
+class InvalidPDFError(ValueError):
+    pass
+
+
 class PDFProcessor:
     @staticmethod
-    def extract_text_and_metadata(pdf_content: bytes) -> Tuple[str, Optional[int]]:
+    def inspect_document(pdf_path: Union[str, Path], max_pages: int) -> Tuple[int, Optional[List[str]]]:
+        # Validates and, for small documents, extracts in the same open.
+        # A page count of 0 means the file is not a usable PDF.
         try:
-            # Load PDF from in-memory bytes
-            pdf_stream = io.BytesIO(pdf_content)
-            doc = pymupdf.open(stream=pdf_stream, filetype="pdf")
-            
-            text_parts = []
-            for page in doc:
-                text_parts.append(page.get_text())
-            
-            extracted_text = "\n".join(text_parts)
+            doc = pymupdf.open(pdf_path, filetype="pdf")
+        except:
+            return 0, None
+
+        with doc:
             page_count = len(doc)
-            return extracted_text, page_count
+            if page_count == 0 or page_count > max_pages:
+                return page_count, None
+            try:
+                return page_count, [page.get_text() for page in doc]
+            except Exception as e:
+                raise ValueError(f"Failed to process PDF: {str(e)}")
 
+    @staticmethod
+    def extract_page_range(pdf_path: Union[str, Path], start: int, end: int) -> List[str]:
+        try:
+            with pymupdf.open(pdf_path, filetype="pdf") as doc:
+                return [doc[i].get_text() for i in range(start, end)]
         except Exception as e:
-            raise ValueError(f"Failed to process PDF: {str(e)}")
+            raise ValueError(f"Failed to process PDF pages {start}-{end}: {str(e)}")
 
     @staticmethod
-    def is_valid_pdf(content: bytes) -> bool:
+    def iter_page_texts(pdf_path: Union[str, Path]) -> Iterator[str]:
         try:
-            doc = pymupdf.open(stream=content, filetype="pdf")
-            return len(doc) > 0
-        except:
-            return False
+            doc = pymupdf.open(pdf_path, filetype="pdf")
+        except Exception:
+            raise InvalidPDFError("File is not a valid PDF")
+
+        with doc:
+            if len(doc) == 0:
+                raise InvalidPDFError("File is not a valid PDF")
+            for page in doc:
+                yield page.get_text()
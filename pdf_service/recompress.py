@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Recompress extracted text already stored by the PDF service.
+
+Converts plain .txt files (per-document legacy files and content-addressed
+blobs) into framed .txtz files and reports the space saved. Safe to run
+while the service is serving traffic: each file is rewritten to a temporary
+name and renamed into place, and readers prefer .txtz over .txt.
+
+Usage:
+    python -m pdf_service.recompress [--codec gzip|zstd] [--block-size BYTES] [STORAGE_DIR]
+"""
+
+import argparse
+import os
+from pathlib import Path
+from typing import Iterator, Tuple
+
+from .compression import DEFAULT_BLOCK_SIZE, FramedTextWriter, codec_id_for
+
+
+def find_plain_text_files(storage_dir: Path) -> Iterator[Path]:
+    yield from storage_dir.glob("*.txt")
+    yield from (storage_dir / "blobs").glob("*/*.txt")
+
+
+def recompress_file(text_path: Path, codec: str, block_size: int) -> Tuple[int, int]:
+    target_path = text_path.with_suffix(".txtz")
+    tmp_path = target_path.with_name(f"{target_path.name}.{os.getpid()}.recompress.tmp")
+    
+    try:
+        with open(text_path, 'rb') as src, FramedTextWriter(tmp_path, codec, block_size) as dst:
+            while True:
+                chunk = src.read(block_size)
+                if not chunk:
+                    break
+                dst.write(chunk)
+        with open(tmp_path, 'rb') as f:
+            os.fsync(f.fileno())
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    
+    before = text_path.stat().st_size
+    after = tmp_path.stat().st_size
+    os.replace(tmp_path, target_path)
+    text_path.unlink()
+    return before, after
+
+
+def recompress_directory(storage_dir: Path, codec: str, block_size: int) -> Tuple[int, int, int]:
+    codec_id_for(codec)
+    files = 0
+    total_before = 0
+    total_after = 0
+    
+    for text_path in find_plain_text_files(storage_dir):
+        try:
+            before, after = recompress_file(text_path, codec, block_size)
+        except FileNotFoundError:
+            # Deleted by the service while we were working on it
+            continue
+        files += 1
+        total_before += before
+        total_after += after
+        print(f"{text_path}: {before} -> {after} bytes")
+    
+    return files, total_before, total_after
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompress stored document text")
+    parser.add_argument("storage_dir", nargs="?", default=os.getenv("STORAGE_DIR", "uploads"))
+    parser.add_argument("--codec", default=os.getenv("TEXT_COMPRESSION", "gzip"), choices=["gzip", "zstd"])
+    parser.add_argument(
+        "--block-size",
+        type=int,
+        default=int(os.getenv("TEXT_COMPRESSION_BLOCK_SIZE", str(DEFAULT_BLOCK_SIZE)))
+    )
+    args = parser.parse_args()
+    
+    files, before, after = recompress_directory(Path(args.storage_dir), args.codec, args.block_size)
+    saved = before - after
+    ratio = (saved / before * 100) if before else 0.0
+    print(f"Recompressed {files} files: {before} -> {after} bytes, saved {saved} bytes ({ratio:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,79 +1,440 @@
+import base64
+import hashlib
 import json
+import os
+import tempfile
+import threading
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from .models import DocumentMetadata
+from .metadata_store import create_metadata_store, upload_order_key
+from .text_cache import TextCache
+from .locks import FileLock
+from .compression import DEFAULT_BLOCK_SIZE, codec_id_for, open_text_reader, open_text_writer
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+TEXT_STREAM_CHUNK_SIZE = 64 * 1024
+PAGE_SEPARATOR = "\n"
+TEXT_SUFFIXES = (".txtz", ".txt")
+ARTIFACT_SUFFIXES = (".pdf", ".txtz", ".txt", ".pages.json")
+# Hex characters of the key hash used to pick a blob lock, i.e. 16 ** 2 lock files
+BLOB_LOCK_STRIPE_CHARS = 2
+
+
+class UploadTooLargeError(ValueError):
+    pass
+
+
+def _temp_path(path: Path) -> Path:
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    os.close(fd)
+    return Path(tmp_name)
+
+
+class TextBlobWriter:
+    def __init__(self, text_path: Path, pages_path: Path, codec: str, block_size: int):
+        self.text_path = text_path
+        self.pages_path = pages_path
+        # Unique per writer: several writers may produce the same blob at once
+        self._tmp_text_path = _temp_path(text_path)
+        self._tmp_pages_path = _temp_path(pages_path)
+        self._file = open_text_writer(self._tmp_text_path, codec, block_size)
+        # Byte offsets of each page inside the UTF-8 text file, end exclusive
+        self.page_offsets: List[List[int]] = []
+        self.text_length = 0
+        self._offset = 0
+
+    def add_page(self, page_text: str) -> Tuple[int, int]:
+        if self.page_offsets:
+            self._offset += self._file.write(PAGE_SEPARATOR.encode('utf-8'))
+            self.text_length += len(PAGE_SEPARATOR)
+        start_byte = self._offset
+        start_char = self.text_length
+        self._offset += self._file.write(page_text.encode('utf-8'))
+        self.text_length += len(page_text)
+        self.page_offsets.append([start_byte, self._offset])
+        return start_char, self.text_length
+
+    def commit(self):
+        self._file.close()
+        with open(self._tmp_pages_path, 'w') as f:
+            json.dump(self.page_offsets, f)
+        # Concurrent uploads of the same content write identical files, so last rename wins
+        os.replace(self._tmp_pages_path, self.pages_path)
+        os.replace(self._tmp_text_path, self.text_path)
+
+    def abort(self):
+        self._file.close()
+        self._tmp_text_path.unlink(missing_ok=True)
+        self._tmp_pages_path.unlink(missing_ok=True)
+
+
+def encode_cursor(metadata: DocumentMetadata) -> str:
+    raw = json.dumps(list(upload_order_key(metadata)), separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        upload_timestamp, doc_id = json.loads(base64.urlsafe_b64decode(padded))
+        return str(upload_timestamp), str(doc_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
 
 class DocumentStorage:
-    def __init__(self, storage_dir: str = "uploads"):
+    def __init__(self, storage_dir: str = "uploads", max_upload_size: Optional[int] = None):
         self.storage_dir = Path(storage_dir)
         self.storage_dir.mkdir(exist_ok=True)
-        self.metadata_file = self.storage_dir / "metadata.json"
-        self._load_metadata()
-
-    def _load_metadata(self):
-        if self.metadata_file.exists():
-            with open(self.metadata_file, 'r') as f:
-                data = json.load(f)
-                self.metadata = {
-                    doc_id: DocumentMetadata(**meta) 
-                    for doc_id, meta in data.items()
-                }
-        else:
-            self.metadata = {}
-
-    def _save_metadata(self):
-        data = {
-            doc_id: meta.model_dump(mode='json')
-            for doc_id, meta in self.metadata.items()
-        }
-        with open(self.metadata_file, 'w') as f:
-            json.dump(data, f, indent=2, default=str)
-
-    def save_document(self, doc_id: str, filename: str, content: bytes, 
-                     extracted_text: str, page_count: Optional[int] = None) -> DocumentMetadata:   
-        pdf_path = self.storage_dir / f"{doc_id}.pdf"
-        text_path = self.storage_dir / f"{doc_id}.txt"
-        
-        with open(pdf_path, 'wb') as f:
-            f.write(content)
-        
-        with open(text_path, 'w', encoding='utf-8') as f:
-            f.write(extracted_text)
+        # Staging lives next to the final files so promotion is a plain rename
+        self.staging_dir = self.storage_dir / "staging"
+        self.staging_dir.mkdir(exist_ok=True)
+        # PDFs and extracted text are stored once per content hash
+        self.blob_dir = self.storage_dir / "blobs"
+        self.blob_dir.mkdir(exist_ok=True)
+        self.max_upload_size = max_upload_size or int(os.getenv("MAX_UPLOAD_SIZE", str(500 * 1024 * 1024)))
+        self.text_compression = os.getenv("TEXT_COMPRESSION", "none")
+        self.text_block_size = int(os.getenv("TEXT_COMPRESSION_BLOCK_SIZE", str(DEFAULT_BLOCK_SIZE)))
+        if self.text_compression != "none":
+            codec_id_for(self.text_compression)
+        self.metadata_store = create_metadata_store(
+            os.getenv("METADATA_BACKEND", "sqlite"), self.storage_dir
+        )
+        # Keyed by text file path so deduplicated documents share one entry
+        self.text_cache = TextCache(int(os.getenv("TEXT_CACHE_MAX_BYTES", str(256 * 1024 * 1024))))
+        # Serialise reference checks against blob creation and removal, striped by content
+        # hash so unrelated uploads do not wait on each other; shared by every worker process
+        self.lock_dir = self.storage_dir / "locks"
+        self.lock_dir.mkdir(exist_ok=True)
+        self._blob_locks: Dict[str, FileLock] = {}
+        self._blob_locks_guard = threading.Lock()
+
+    async def stage_upload(self, file) -> Tuple[Path, int, str]:
+        fd, tmp_name = tempfile.mkstemp(dir=self.staging_dir, suffix=".pdf")
+        staged_path = Path(tmp_name)
+        size = 0
+        digest = hashlib.sha256()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_upload_size:
+                        raise UploadTooLargeError(
+                            f"File exceeds maximum upload size of {self.max_upload_size} bytes"
+                        )
+                    digest.update(chunk)
+                    f.write(chunk)
+        except BaseException:
+            staged_path.unlink(missing_ok=True)
+            raise
+        return staged_path, size, digest.hexdigest()
+
+    def discard_staged(self, staged_path: Path):
+        staged_path.unlink(missing_ok=True)
+
+    def _blob_lock(self, key: str) -> FileLock:
+        stripe = hashlib.sha256(key.encode()).hexdigest()[:BLOB_LOCK_STRIPE_CHARS]
+        with self._blob_locks_guard:
+            lock = self._blob_locks.get(stripe)
+            if lock is None:
+                lock = self._blob_locks[stripe] = FileLock(self.lock_dir / f"blobs.{stripe}.lock")
+        return lock
+
+    def _document_lock(self, metadata: DocumentMetadata) -> FileLock:
+        # Documents stored before deduplication own their files, so they lock on their ID
+        return self._blob_lock(metadata.content_hash or metadata.doc_id)
+
+    def _blob_path(self, content_hash: str, suffix: str) -> Path:
+        return self.blob_dir / content_hash[:2] / f"{content_hash}{suffix}"
+
+    def _artifact_base(self, doc_id: str) -> Optional[Path]:
+        metadata = self.metadata_store.get(doc_id)
+        if metadata is None:
+            return None
+        if metadata.content_hash:
+            return self._blob_path(metadata.content_hash, "")
+        # Documents stored before deduplication keep per-document files
+        return self.storage_dir / doc_id
+
+    @staticmethod
+    def _find_text_path(base: Optional[Path]) -> Optional[Path]:
+        if base is None:
+            return None
+        for suffix in TEXT_SUFFIXES:
+            path = base.with_name(base.name + suffix)
+            if path.exists():
+                return path
+        return None
+
+    def open_text_blob(self, content_hash: str) -> "TextBlobWriter":
+        text_suffix = ".txt" if self.text_compression == "none" else ".txtz"
+        text_path = self._blob_path(content_hash, text_suffix)
+        text_path.parent.mkdir(exist_ok=True)
+        return TextBlobWriter(
+            text_path,
+            self._blob_path(content_hash, ".pages.json"),
+            self.text_compression,
+            self.text_block_size
+        )
+
+    def _commit_text_blob(self, writer: "TextBlobWriter"):
+        writer.commit()
+        self.text_cache.invalidate(str(writer.text_path))
+
+    def _write_text(self, content_hash: str, pages: List[str]) -> int:
+        writer = self.open_text_blob(content_hash)
+        try:
+            for page_text in pages:
+                writer.add_page(page_text)
+        except BaseException:
+            writer.abort()
+            raise
+        self._commit_text_blob(writer)
+        return writer.text_length
+
+    def _text_blob_exists(self, content_hash: str) -> bool:
+        return self._blob_path(content_hash, ".pages.json").exists() and \
+            self._find_text_path(self._blob_path(content_hash, "")) is not None
+
+    def _remove_artifacts(self, paths: List[Path]):
+        for path in paths:
+            path.unlink(missing_ok=True)
+            self.text_cache.invalidate(str(path))
+
+    def find_existing_content(self, content_hash: str) -> Optional[DocumentMetadata]:
+        existing = self.metadata_store.find_by_content_hash(content_hash)
+        if existing is None:
+            return None
+        if existing.status != "ready":
+            return None
+        if not self._blob_path(content_hash, ".pdf").exists() or self._find_text_path(self._blob_path(content_hash, "")) is None:
+            return None
+        return existing
+
+    def save_document(self, doc_id: str, filename: str, staged_path: Path, content_hash: str,
+                     pages: List[str], page_count: Optional[int] = None) -> DocumentMetadata:   
+        file_size = staged_path.stat().st_size
+        # Blobs are content-addressed and promoted by rename, so the text is written
+        # and compressed without holding the lock
+        text_length = self._write_text(content_hash, pages)
         
+        with self._blob_lock(content_hash):
+            # Deleting the last other reference may have removed the text in the meantime
+            if not self._text_blob_exists(content_hash):
+                text_length = self._write_text(content_hash, pages)
+            os.replace(staged_path, self._blob_path(content_hash, ".pdf"))
+            
+            metadata = DocumentMetadata(
+                doc_id=doc_id,
+                filename=filename,
+                upload_timestamp=datetime.utcnow(),
+                file_size=file_size,
+                page_count=page_count,
+                text_length=text_length,
+                content_hash=content_hash
+            )
+            self.metadata_store.put(metadata)
+        return metadata
+
+    def save_duplicate(self, doc_id: str, filename: str, existing: DocumentMetadata) -> Optional[DocumentMetadata]:
         metadata = DocumentMetadata(
             doc_id=doc_id,
             filename=filename,
             upload_timestamp=datetime.utcnow(),
-            file_size=len(content),
-            page_count=page_count,
-            text_length=len(extracted_text)
+            file_size=existing.file_size,
+            page_count=existing.page_count,
+            text_length=existing.text_length,
+            content_hash=existing.content_hash
         )
         
-        self.metadata[doc_id] = metadata
-        self._save_metadata()
+        with self._blob_lock(existing.content_hash):
+            # The last other reference may have been deleted since the lookup
+            if self.metadata_store.count_references(existing.content_hash) == 0:
+                return None
+            self.metadata_store.put(metadata)
+        return metadata
+
+    def save_pending(self, doc_id: str, filename: str, staged_path: Path, content_hash: str) -> DocumentMetadata:
+        file_size = staged_path.stat().st_size
+        pdf_path = self._blob_path(content_hash, ".pdf")
+        
+        with self._blob_lock(content_hash):
+            pdf_path.parent.mkdir(exist_ok=True)
+            os.replace(staged_path, pdf_path)
+            
+            metadata = DocumentMetadata(
+                doc_id=doc_id,
+                filename=filename,
+                upload_timestamp=datetime.utcnow(),
+                file_size=file_size,
+                content_hash=content_hash,
+                status="processing"
+            )
+            self.metadata_store.put(metadata)
+        return metadata
+
+    def get_pdf_path(self, doc_id: str) -> Optional[Path]:
+        base = self._artifact_base(doc_id)
+        return base.with_name(base.name + ".pdf") if base is not None else None
+
+    def complete_document(self, doc_id: str, pages: List[str], page_count: Optional[int]) -> Optional[DocumentMetadata]:
+        metadata = self.metadata_store.get(doc_id)
+        if metadata is None:
+            return None
+        content_hash = metadata.content_hash
+        text_length = self._write_text(content_hash, pages)
+        
+        with self._blob_lock(content_hash):
+            metadata = self.metadata_store.get(doc_id)
+            if metadata is None:
+                # Deleted while its extraction job was running
+                if self.metadata_store.count_references(content_hash) == 0:
+                    self._remove_artifacts([self._blob_path(content_hash, suffix) for suffix in ARTIFACT_SUFFIXES])
+                return None
+            
+            if not self._text_blob_exists(content_hash):
+                text_length = self._write_text(content_hash, pages)
+            metadata = metadata.model_copy(update={
+                "page_count": page_count,
+                "text_length": text_length,
+                "status": "ready",
+                "error": None
+            })
+            self.metadata_store.put(metadata)
+        return metadata
+
+    def complete_streamed_document(self, doc_id: str, writer: "TextBlobWriter") -> Optional[DocumentMetadata]:
+        metadata = self.metadata_store.get(doc_id)
+        if metadata is None:
+            writer.abort()
+            return None
+        
+        with self._document_lock(metadata):
+            metadata = self.metadata_store.get(doc_id)
+            if metadata is None:
+                writer.abort()
+                return None
+            
+            self._commit_text_blob(writer)
+            metadata = metadata.model_copy(update={
+                "page_count": len(writer.page_offsets),
+                "text_length": writer.text_length,
+                "status": "ready",
+                "error": None
+            })
+            self.metadata_store.put(metadata)
+        return metadata
+
+    def iter_pages(self, doc_id: str) -> Iterator[str]:
+        page_offsets = self.get_page_offsets(doc_id) or []
+        text_path = self._find_text_path(self._artifact_base(doc_id))
+        reader = open_text_reader(text_path)
+        try:
+            for start, end in page_offsets:
+                yield b"".join(reader.iter_range(start, end, TEXT_STREAM_CHUNK_SIZE)).decode('utf-8')
+        finally:
+            reader.close()
+
+    def fail_document(self, doc_id: str, error: str) -> Optional[DocumentMetadata]:
+        metadata = self.metadata_store.get(doc_id)
+        if metadata is None:
+            return None
+        
+        with self._document_lock(metadata):
+            metadata = self.metadata_store.get(doc_id)
+            if metadata is None:
+                return None
+            metadata = metadata.model_copy(update={"status": "failed", "error": error})
+            self.metadata_store.put(metadata)
         return metadata
 
+    def get_documents_by_status(self, status: str) -> List[DocumentMetadata]:
+        return self.metadata_store.find_by_status(status)
+
+    def delete_document(self, doc_id: str) -> bool:
+        metadata = self.metadata_store.get(doc_id)
+        if metadata is None:
+            return False
+        
+        with self._document_lock(metadata):
+            metadata = self.metadata_store.get(doc_id)
+            if metadata is None or not self.metadata_store.delete(doc_id):
+                return False
+            
+            if metadata.content_hash:
+                if self.metadata_store.count_references(metadata.content_hash) > 0:
+                    return True
+                paths = [self._blob_path(metadata.content_hash, suffix) for suffix in ARTIFACT_SUFFIXES]
+            else:
+                paths = [self.storage_dir / f"{doc_id}{suffix}" for suffix in ARTIFACT_SUFFIXES]
+            self._remove_artifacts(paths)
+        return True
+
     def get_document_metadata(self, doc_id: str) -> Optional[DocumentMetadata]:
-        return self.metadata.get(doc_id)
+        return self.metadata_store.get(doc_id)
 
     def get_document_text(self, doc_id: str) -> Optional[str]:
-        text_path = self.storage_dir / f"{doc_id}.txt"
-        if text_path.exists():
-            with open(text_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        return None
+        text_path = self._find_text_path(self._artifact_base(doc_id))
+        if text_path is None:
+            return None
+        
+        cached = self.text_cache.get(str(text_path))
+        if cached is not None:
+            return cached
+        
+        reader = open_text_reader(text_path)
+        try:
+            raw = b"".join(reader.iter_range(0, reader.size, TEXT_STREAM_CHUNK_SIZE))
+        finally:
+            reader.close()
+        text = raw.decode('utf-8')
+        self.text_cache.put(str(text_path), text, len(raw))
+        return text
+
+    def get_page_offsets(self, doc_id: str) -> Optional[List[Tuple[int, int]]]:
+        base = self._artifact_base(doc_id)
+        if base is None:
+            return None
+        pages_path = base.with_name(base.name + ".pages.json")
+        if not pages_path.exists():
+            return None
+        with open(pages_path, 'r') as f:
+            return [tuple(span) for span in json.load(f)]
+
+    def get_text_size(self, doc_id: str) -> Optional[int]:
+        text_path = self._find_text_path(self._artifact_base(doc_id))
+        if text_path is None:
+            return None
+        reader = open_text_reader(text_path)
+        reader.close()
+        return reader.size
+
+    def iter_text_range(self, doc_id: str, start: int, end: int) -> Iterator[bytes]:
+        reader = open_text_reader(self._find_text_path(self._artifact_base(doc_id)))
+        try:
+            yield from reader.iter_range(start, end, TEXT_STREAM_CHUNK_SIZE)
+        finally:
+            reader.close()
 
     def get_all_documents(self, page: int = 1, limit: int = 10) -> tuple[List[DocumentMetadata], int]:
-        all_docs = list(self.metadata.values())
-        all_docs.sort(key=lambda x: x.upload_timestamp, reverse=True)
-        
         start_idx = (page - 1) * limit
-        end_idx = start_idx + limit
-        
-        return all_docs[start_idx:end_idx], len(all_docs)
+        return self.metadata_store.list_documents(start_idx, limit), self.metadata_store.count()
 
-    def document_exists(self, doc_id: str) -> bool:
-        return doc_id in self.metadata
+    def list_documents_page(self, cursor: Optional[str], limit: int) -> tuple[List[DocumentMetadata], Optional[str]]:
+        key = decode_cursor(cursor) if cursor else None
+        # Fetch one extra row to know whether another page follows
+        docs = self.metadata_store.list_documents_before(key, limit + 1)
+        next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+        return docs[:limit], next_cursor
 
+    def count_documents(self) -> int:
+        return self.metadata_store.count()
+
+    def document_exists(self, doc_id: str) -> bool:
+        return self.metadata_store.exists(doc_id)
@@ -0,0 +1,147 @@
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .models import QueryResponse
+
+DocumentSetKey = Tuple[str, ...]
+
+
+def document_set_key(document_ids: List[str]) -> DocumentSetKey:
+    return tuple(sorted(set(document_ids)))
+
+
+def _normalize(vector: List[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
+
+
+class _QuestionIndex:
+    # Unit question vectors of one document set, one row per cached answer,
+    # so a lookup is a single matrix-vector product
+    def __init__(self, dimension: int):
+        self.ids: List[int] = []
+        self.vectors = np.empty((8, dimension), dtype=np.float32)
+
+    @property
+    def dimension(self) -> int:
+        return self.vectors.shape[1]
+
+    def add(self, entry_id: int, vector: np.ndarray):
+        if len(self.ids) == len(self.vectors):
+            self.vectors = np.concatenate([self.vectors, np.empty_like(self.vectors)])
+        self.vectors[len(self.ids)] = vector
+        self.ids.append(entry_id)
+
+    def remove(self, entry_id: int):
+        # The last row fills the gap so the rows stay contiguous
+        row = self.ids.index(entry_id)
+        last = len(self.ids) - 1
+        self.vectors[row] = self.vectors[last]
+        self.ids[row] = self.ids[last]
+        self.ids.pop()
+
+    def best_match(self, query: np.ndarray) -> Tuple[Optional[int], float]:
+        if not self.ids or query.shape[0] != self.dimension:
+            return None, -1.0
+        scores = self.vectors[:len(self.ids)] @ query
+        row = int(np.argmax(scores))
+        return self.ids[row], float(scores[row])
+
+
+class AnswerCache:
+    def __init__(self, max_entries: Optional[int] = None, threshold: Optional[float] = None):
+        self.max_entries = max_entries if max_entries is not None else int(
+            os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000")
+        )
+        self.threshold = threshold if threshold is not None else float(
+            os.getenv("ANSWER_CACHE_SIMILARITY", "0.95")
+        )
+        # Insertion order is LRU order; each entry is (document set, response)
+        self._entries: "OrderedDict[int, Tuple[DocumentSetKey, QueryResponse]]" = OrderedDict()
+        self._by_document_set: Dict[DocumentSetKey, _QuestionIndex] = {}
+        # Bumped whenever a document is re-indexed; answers computed against an older version are discarded
+        self._document_versions: Dict[str, int] = {}
+        # Answers over all documents (an empty document set) depend on every document
+        self._all_documents_version = 0
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def snapshot(self, document_ids: List[str]) -> Tuple[int, ...]:
+        key = document_set_key(document_ids)
+        if not key:
+            return (self._all_documents_version,)
+        return tuple(self._document_versions.get(doc_id, 0) for doc_id in key)
+
+    def lookup(self, document_ids: List[str], question_embedding: List[float]) -> Optional[QueryResponse]:
+        if not self.enabled:
+            return None
+        index = self._by_document_set.get(document_set_key(document_ids))
+        best_id, best_score = index.best_match(_normalize(question_embedding)) if index else (None, -1.0)
+        if best_id is None or best_score < self.threshold:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(best_id)
+        self.hits += 1
+        return self._entries[best_id][1]
+
+    def put(self, document_ids: List[str], question_embedding: List[float],
+            response: QueryResponse, snapshot: Tuple[int, ...]):
+        if not self.enabled or snapshot != self.snapshot(document_ids):
+            return
+        key = document_set_key(document_ids)
+        vector = _normalize(question_embedding)
+        index = self._by_document_set.setdefault(key, _QuestionIndex(vector.shape[0]))
+        if index.dimension != vector.shape[0]:
+            return
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = (key, response)
+        index.add(entry_id, vector)
+        while len(self._entries) > self.max_entries:
+            evicted_id, _ = next(iter(self._entries.items()))
+            self._remove(evicted_id)
+            self.evictions += 1
+
+    def _remove(self, entry_id: int):
+        key, _ = self._entries.pop(entry_id)
+        index = self._by_document_set[key]
+        index.remove(entry_id)
+        if not index.ids:
+            del self._by_document_set[key]
+
+    def invalidate_documents(self, document_ids: List[str]):
+        changed = set(document_ids)
+        if not changed:
+            return
+        for doc_id in changed:
+            self._document_versions[doc_id] = self._document_versions.get(doc_id, 0) + 1
+        self._all_documents_version += 1
+        stale = [key for key in self._by_document_set if not key or changed.intersection(key)]
+        for key in stale:
+            for entry_id in list(self._by_document_set[key].ids):
+                self._remove(entry_id)
+                self.invalidations += 1
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
@@ -1,9 +1,15 @@
+import hashlib
 import os
-import uuid
 from typing import List
 from .models import DocumentChunk
 
 
+def chunk_id_for(document_id: str, chunk_index: int, text: str) -> str:
+    # Stable across re-indexing, and prefixed by document so a document's chunks can be listed
+    text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+    return f"{document_id}#{chunk_index}#{text_hash}"
+
+
 class TextChunker:
     def __init__(self, chunk_size: int = None, overlap: int = None):
         self.chunk_size = chunk_size or int(os.getenv("CHUNK_SIZE", "1000"))
@@ -27,7 +33,7 @@ class TextChunker:
             
             if chunk_text:
                 chunk = DocumentChunk(
-                    chunk_id=str(uuid.uuid4()),
+                    chunk_id=chunk_id_for(document_id, chunk_index, chunk_text),
                     document_id=document_id,
                     text=chunk_text,
                     chunk_index=chunk_index,
@@ -0,0 +1,86 @@
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from .tokens import TokenCounter
+
+# How far past the recorded overlap to look for repeated text; chunk texts are
+# stripped, so their offsets can be off by a few whitespace characters
+OVERLAP_SLACK = 16
+
+
+@dataclass
+class PackedContext:
+    segments: List[Dict[str, Any]]
+    raw_tokens: int
+    packed_tokens: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(self.raw_tokens - self.packed_tokens, 0)
+
+
+def _overlap_length(previous: str, following: str, expected: int) -> int:
+    # Longest suffix of previous that is a prefix of following, bounded near the expected overlap
+    for length in range(min(len(previous), len(following), expected + OVERLAP_SLACK), 0, -1):
+        if previous.endswith(following[:length]):
+            return length
+    return min(max(expected, 0), len(following))
+
+
+class ContextBuilder:
+    def __init__(self, max_tokens: Optional[int] = None, model: Optional[str] = None):
+        self.max_tokens = max_tokens or int(os.getenv("CONTEXT_MAX_TOKENS", "3000"))
+        self.tokens = TokenCounter(model or os.getenv("LLM_MODEL", "gpt-3.5-turbo"))
+
+    def merge_chunks(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        by_document: Dict[str, List[Dict[str, Any]]] = {}
+        for chunk in chunks:
+            by_document.setdefault(chunk['document_id'], []).append(chunk)
+
+        segments = []
+        for document_id, document_chunks in by_document.items():
+            document_chunks.sort(key=lambda chunk: (chunk.get('start_char') or 0, chunk.get('end_char') or 0))
+            current = None
+            for chunk in document_chunks:
+                start, end = chunk.get('start_char'), chunk.get('end_char')
+                if current is not None and None not in (start, end, current['end_char']) \
+                        and start <= current['end_char']:
+                    if end > current['end_char']:
+                        overlap = _overlap_length(current['text'], chunk['text'], current['end_char'] - start)
+                        current['text'] += chunk['text'][overlap:]
+                        current['end_char'] = end
+                        current['last_chunk_index'] = chunk['chunk_index']
+                    current['score'] = max(current['score'], chunk.get('score', 0))
+                    continue
+                current = {
+                    'document_id': document_id,
+                    'chunk_index': chunk['chunk_index'],
+                    'last_chunk_index': chunk['chunk_index'],
+                    'start_char': start,
+                    'end_char': end,
+                    'text': chunk['text'],
+                    'score': chunk.get('score', 0)
+                }
+                segments.append(current)
+        return segments
+
+    def build(self, chunks: List[Dict[str, Any]]) -> PackedContext:
+        raw_tokens = sum(self.tokens.count_many([chunk['text'] for chunk in chunks])) if chunks else 0
+        segments = self.merge_chunks(chunks)
+        segments.sort(key=lambda segment: segment['score'], reverse=True)
+
+        packed = []
+        packed_tokens = 0
+        segment_tokens = self.tokens.count_many([segment['text'] for segment in segments]) if segments else []
+        for segment, tokens in zip(segments, segment_tokens):
+            remaining = self.max_tokens - packed_tokens
+            if tokens <= remaining:
+                packed.append(segment)
+                packed_tokens += tokens
+            elif not packed:
+                # Never send an empty context: cut the best segment down to the budget
+                segment['text'] = self.tokens.truncate(segment['text'], remaining)
+                packed.append(segment)
+                packed_tokens += self.tokens.count(segment['text'])
+        return PackedContext(segments=packed, raw_tokens=raw_tokens, packed_tokens=packed_tokens)
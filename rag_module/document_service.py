@@ -1,32 +1,134 @@
+import asyncio
+import json
 import os
-import httpx
-from typing import Dict, Optional
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from .http_pool import HTTPPool
+
+
+class BatchEndpointUnavailable(Exception):
+    pass
 
 
 class DocumentService:
     def __init__(self):
         self.pdf_service_url = os.getenv("PDF_SERVICE_URL", "http://pdf_service:8000")
         self.timeout = float(os.getenv("PDF_SERVICE_TIMEOUT", "30.0"))
+        self.concurrency = int(os.getenv("PDF_SERVICE_CONCURRENCY", "8"))
+        self.http = HTTPPool("pdf_service", self.timeout)
+        # Validator cache: document ID -> (ETag, text, size), revalidated with If-None-Match
+        # and bounded by the UTF-8 size of the cached texts
+        self.cache_max_bytes = int(os.getenv("DOCUMENT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+        self._cache: "OrderedDict[str, Tuple[str, str, int]]" = OrderedDict()
+        self._cache_bytes = 0
+
+    def _cached(self, document_id: str) -> Optional[Tuple[str, str]]:
+        entry = self._cache.get(document_id)
+        if entry is None:
+            return None
+        self._cache.move_to_end(document_id)
+        return entry[0], entry[1]
+
+    def _forget(self, document_id: str):
+        entry = self._cache.pop(document_id, None)
+        if entry is not None:
+            self._cache_bytes -= entry[2]
+
+    def _remember(self, document_id: str, etag: Optional[str], text: Optional[str]):
+        self._forget(document_id)
+        if not etag or not text:
+            return
+        size = len(text.encode('utf-8'))
+        # Texts larger than the whole budget would only evict everything else
+        if size > self.cache_max_bytes:
+            return
+        self._cache[document_id] = (etag, text, size)
+        self._cache_bytes += size
+        while self._cache_bytes > self.cache_max_bytes:
+            _, (_, _, evicted_size) = self._cache.popitem(last=False)
+            self._cache_bytes -= evicted_size
+
+    async def start(self):
+        await self.http.start()
+
+    async def close(self):
+        await self.http.close()
 
     async def get_document_text(self, document_id: str) -> Optional[str]:
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.get(
-                    f"{self.pdf_service_url}/pdf/documents/{document_id}"
-                )
-                if response.status_code == 404:
-                    return None
-                response.raise_for_status()
-                data = response.json()
-                return data.get("extracted_text")
+            return await self._fetch_document_text(document_id)
         except Exception as e:
             print(f"Failed to fetch document {document_id}: {str(e)}")
             return None
 
+    async def _fetch_document_text(self, document_id: str) -> Optional[str]:
+        cached = self._cached(document_id)
+        response = await self.http.get(
+            f"{self.pdf_service_url}/pdf/documents/{document_id}",
+            headers={"If-None-Match": cached[0]} if cached else None
+        )
+        if response.status_code == 304 and cached:
+            return cached[1]
+        if response.status_code == 404:
+            self._forget(document_id)
+            return None
+        response.raise_for_status()
+        data = response.json()
+        text = data.get("extracted_text")
+        self._remember(document_id, response.headers.get("ETag"), text)
+        return text
+
     async def get_documents_text(self, document_ids: list[str]) -> Dict[str, str]:
+        try:
+            return await self._get_documents_text_batch(document_ids)
+        except BatchEndpointUnavailable:
+            return await self._get_documents_text_concurrently(document_ids)
+        except Exception as e:
+            print(f"Batch document fetch failed, falling back to single requests: {str(e)}")
+            return await self._get_documents_text_concurrently(document_ids)
+
+    async def _get_documents_text_batch(self, document_ids: list[str]) -> Dict[str, str]:
         documents = {}
+        # Snapshot the entries whose ETags are sent: remembering earlier records
+        # may evict them from the LRU before their not_modified record arrives
+        known = {}
         for doc_id in document_ids:
-            text = await self.get_document_text(doc_id)
-            if text:
-                documents[doc_id] = text
-        return documents
\ No newline at end of file
+            cached = self._cached(doc_id)
+            if cached:
+                known[doc_id] = cached
+        known_etags = {doc_id: cached[0] for doc_id, cached in known.items()}
+        
+        async with self.http.stream(
+            "POST",
+            f"{self.pdf_service_url}/pdf/documents/batch",
+            json={"doc_ids": document_ids, "if_none_match": known_etags}
+        ) as response:
+            # Servers without the batch endpoint answer 404/405
+            if response.status_code in (404, 405):
+                raise BatchEndpointUnavailable()
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                record = json.loads(line)
+                doc_id = record["doc_id"]
+                if record.get("status") == "not_modified" and doc_id in known:
+                    documents[doc_id] = known[doc_id][1]
+                    self._remember(doc_id, *known[doc_id])
+                elif record.get("extracted_text"):
+                    documents[doc_id] = record["extracted_text"]
+                    self._remember(doc_id, record.get("etag"), record["extracted_text"])
+                elif record.get("status") != "ready":
+                    print(f"Document {record['doc_id']} unavailable: {record.get('status')}")
+        return documents
+
+    async def _get_documents_text_concurrently(self, document_ids: list[str]) -> Dict[str, str]:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(doc_id: str) -> Optional[str]:
+            async with semaphore:
+                return await self.get_document_text(doc_id)
+
+        texts = await asyncio.gather(*[fetch(doc_id) for doc_id in document_ids])
+        return {doc_id: text for doc_id, text in zip(document_ids, texts) if text}
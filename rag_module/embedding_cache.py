@@ -0,0 +1,147 @@
+import hashlib
+import os
+import sqlite3
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# struct format characters for the stored vector encodings
+DTYPE_FORMATS = {"float32": "f", "float16": "e"}
+# Stay well below SQLite's bound-parameter limit
+LOOKUP_BATCH_SIZE = 500
+
+
+def text_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, db_file: Optional[Path] = None, max_entries: Optional[int] = None,
+                 dtype: Optional[str] = None):
+        self.db_file = Path(db_file or os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.db"))
+        self.max_entries = max_entries if max_entries is not None else int(
+            os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000")
+        )
+        self.dtype = dtype or os.getenv("EMBEDDING_CACHE_DTYPE", "float32")
+        if self.dtype not in DTYPE_FORMATS:
+            raise ValueError(f"Unknown embedding cache dtype: {self.dtype}")
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.conn = None
+        if self.enabled:
+            self.db_file.parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(self.db_file, check_same_thread=False, isolation_level=None)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS embeddings (
+                    cache_key TEXT PRIMARY KEY,
+                    dtype TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    last_used REAL NOT NULL
+                )"""
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)"
+            )
+            self._entries = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def cache_key(model: str, dimension: int, text: str) -> str:
+        return f"{model}:{dimension}:{text_digest(text)}"
+
+    def _encode(self, vector: List[float]) -> bytes:
+        return struct.pack(f"<{len(vector)}{DTYPE_FORMATS[self.dtype]}", *vector)
+
+    @staticmethod
+    def _decode(dtype: str, blob: bytes) -> List[float]:
+        fmt = DTYPE_FORMATS[dtype]
+        return list(struct.unpack(f"<{len(blob) // struct.calcsize(fmt)}{fmt}", blob))
+
+    def get_many(self, model: str, dimension: int, texts: List[str]) -> List[Optional[List[float]]]:
+        if not self.enabled:
+            return [None] * len(texts)
+        keys = [self.cache_key(model, dimension, text) for text in texts]
+        found: Dict[str, List[float]] = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            for i in range(0, len(unique_keys), LOOKUP_BATCH_SIZE):
+                batch = unique_keys[i:i + LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT cache_key, dtype, vector FROM embeddings WHERE cache_key IN ({placeholders})",
+                    batch
+                ).fetchall()
+                for cache_key, dtype, blob in rows:
+                    found[cache_key] = self._decode(dtype, blob)
+            if found:
+                now = time.time()
+                self.conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE cache_key = ?",
+                    [(now, cache_key) for cache_key in found]
+                )
+            vectors = [found.get(key) for key in keys]
+            hits = sum(vector is not None for vector in vectors)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return vectors
+
+    def put_many(self, model: str, dimension: int, texts: List[str], vectors: List[List[float]]):
+        if not self.enabled or not texts:
+            return
+        now = time.time()
+        rows = {
+            self.cache_key(model, dimension, text): (self.dtype, self._encode(vector), now)
+            for text, vector in zip(texts, vectors)
+        }
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                existing = 0
+                keys = list(rows)
+                for i in range(0, len(keys), LOOKUP_BATCH_SIZE):
+                    batch = keys[i:i + LOOKUP_BATCH_SIZE]
+                    placeholders = ",".join("?" * len(batch))
+                    existing += self.conn.execute(
+                        f"SELECT COUNT(*) FROM embeddings WHERE cache_key IN ({placeholders})", batch
+                    ).fetchone()[0]
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (cache_key, dtype, vector, last_used) VALUES (?, ?, ?, ?)",
+                    [(cache_key, *row) for cache_key, row in rows.items()]
+                )
+                entries = self._entries + len(rows) - existing
+                excess = entries - self.max_entries
+                if excess > 0:
+                    self.conn.execute(
+                        "DELETE FROM embeddings WHERE cache_key IN "
+                        "(SELECT cache_key FROM embeddings ORDER BY last_used LIMIT ?)",
+                        (excess,)
+                    )
+                    self.evictions += excess
+                    entries -= excess
+                self.conn.execute("COMMIT")
+                self._entries = entries
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": self._entries if self.enabled else 0,
+            "max_entries": self.max_entries,
+            "dtype": self.dtype,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions
+        }
@@ -1,23 +1,103 @@
+import asyncio
 import os
-from typing import List
-from openai import OpenAI
+from typing import List, Optional
+from openai import AsyncOpenAI
+
+from .embedding_cache import EmbeddingCache
+from .tokens import TokenCounter
+
 
 class EmbeddingService:
-    def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    def __init__(self, cache: Optional[EmbeddingCache] = None):
+        self.client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
         self.model = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+        self.dimension = int(os.getenv("EMBEDDING_DIMENSION", "1536"))
+        self.cache = cache or EmbeddingCache()
+        self.api_requests = 0
+        self.api_requests_saved = 0
+        self.batch_max_tokens = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "100000"))
+        self.batch_max_items = int(os.getenv("EMBEDDING_BATCH_MAX_ITEMS", "2048"))
+        self.concurrency = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+        self.tokens = TokenCounter(self.model)
+
+    async def close(self):
+        await self.client.close()
+
+    def _plan_batches(self, texts: List[str]) -> List[List[int]]:
+        batches = []
+        current: List[int] = []
+        current_tokens = 0
+        for index, tokens in enumerate(self.tokens.count_many(texts)):
+            if current and (current_tokens + tokens > self.batch_max_tokens or len(current) >= self.batch_max_items):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(index)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        self.api_requests += 1
+        response = await self.client.embeddings.create(
+            model=self.model,
+            input=texts,
+            encoding_format="float"
+        )
+        # The API may return items out of order; index refers to the input position
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
 
     async def create_embeddings(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        try:
+            embeddings = await asyncio.to_thread(self.cache.get_many, self.model, self.dimension, texts)
+        except Exception as e:
+            print(f"Embedding cache lookup failed: {str(e)}")
+            embeddings = [None] * len(texts)
+
+        # Identical texts are embedded once
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, embeddings) if vector is None))
+        if not missing:
+            self.api_requests_saved += 1
+            return embeddings
+
+        vectors = await self._embed_uncached(missing)
         try:
-            response = self.client.embeddings.create(
-                model=self.model,
-                input=texts,
-                encoding_format="float"
-            )
-            return [embedding.embedding for embedding in response.data]
+            await asyncio.to_thread(self.cache.put_many, self.model, self.dimension, missing, vectors)
+        except Exception as e:
+            print(f"Embedding cache update failed: {str(e)}")
+
+        embedded = dict(zip(missing, vectors))
+        return [vector if vector is not None else embedded[text] for text, vector in zip(texts, embeddings)]
+
+    async def _embed_uncached(self, texts: List[str]) -> List[List[float]]:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def embed(batch: List[int]) -> List[List[float]]:
+            async with semaphore:
+                return await self._embed_batch([texts[index] for index in batch])
+
+        try:
+            # Tokenising (and loading the encoding on first use) stays off the event loop
+            batches = await asyncio.to_thread(self._plan_batches, texts)
+            results = await asyncio.gather(*[embed(batch) for batch in batches])
         except Exception as e:
             raise ValueError(f"Failed to create embeddings: {str(e)}")
 
+        embeddings: List[List[float]] = [None] * len(texts)
+        for batch, vectors in zip(batches, results):
+            for index, vector in zip(batch, vectors):
+                embeddings[index] = vector
+        return embeddings
+
+    def stats(self) -> dict:
+        return {
+            "api_requests": self.api_requests,
+            "api_requests_saved": self.api_requests_saved,
+            "cache": self.cache.stats()
+        }
+
     async def create_embedding(self, text: str) -> List[float]:
         embeddings = await self.create_embeddings([text])
-        return embeddings[0]
\ No newline at end of file
+        return embeddings[0]
@@ -0,0 +1,109 @@
+import asyncio
+import os
+import random
+from typing import Any, Dict, Optional
+
+import httpx
+
+try:
+    import h2
+except ImportError:
+    h2 = None
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_STATUS_CODES = {502, 503, 504}
+# Raised before the request reached the server, so any method can be retried
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class HTTPPool:
+    def __init__(self, name: str, timeout: float):
+        self.name = name
+        self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20")),
+            keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30.0"))
+        )
+        self.http2 = os.getenv("HTTP2_ENABLED", "false").lower() == "true"
+        if self.http2 and h2 is None:
+            print(f"Warning: HTTP2_ENABLED is set but the 'h2' package is missing, {name} uses HTTP/1.1")
+            self.http2 = False
+        self.retries = int(os.getenv("HTTP_RETRIES", "2"))
+        self.retry_backoff = float(os.getenv("HTTP_RETRY_BACKOFF", "0.2"))
+        self._client: Optional[httpx.AsyncClient] = None
+        self._requests = 0
+        self._connections_opened = 0
+        self._retried = 0
+
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits, http2=self.http2)
+
+    async def close(self):
+        client, self._client = self._client, None
+        if client is not None:
+            await client.aclose()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created lazily when used outside the app lifespan (scripts, tests)
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits, http2=self.http2)
+        return self._client
+
+    async def _trace(self, event_name: str, info: Dict[str, Any]):
+        # httpcore trace events: one connect per new connection, one send per request on the wire
+        if event_name == "connection.connect_tcp.complete":
+            self._connections_opened += 1
+        elif event_name in ("http11.send_request_headers.started", "http2.send_request_headers.started"):
+            self._requests += 1
+
+    def _with_trace(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        kwargs["extensions"] = {**kwargs.get("extensions", {}), "trace": self._trace}
+        return kwargs
+
+    async def request(self, method: str, url: str, retry: Optional[bool] = None, **kwargs) -> httpx.Response:
+        if retry is None:
+            retry = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            try:
+                response = await self.client.request(method, url, **self._with_trace(kwargs))
+                if not retry or response.status_code not in RETRY_STATUS_CODES or attempt >= self.retries:
+                    return response
+                await response.aclose()
+            except CONNECT_ERRORS:
+                if attempt >= self.retries:
+                    raise
+            except httpx.TransportError:
+                if not retry or attempt >= self.retries:
+                    raise
+            attempt += 1
+            self._retried += 1
+            # Full jitter keeps concurrent callers from retrying in lockstep
+            await asyncio.sleep(random.uniform(0, self.retry_backoff * 2 ** attempt))
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    def stream(self, method: str, url: str, **kwargs):
+        return self.client.stream(method, url, **self._with_trace(kwargs))
+
+    async def open_stream(self, method: str, url: str, **kwargs) -> httpx.Response:
+        # For responses relayed beyond the caller's scope; the caller must aclose() them
+        request = self.client.build_request(method, url, **self._with_trace(kwargs))
+        return await self.client.send(request, stream=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self._requests,
+            "connections_opened": self._connections_opened,
+            "connections_reused": max(self._requests - self._connections_opened, 0),
+            "retries": self._retried,
+            "http2": self.http2,
+            "open": self._client is not None
+        }
@@ -0,0 +1,156 @@
+import asyncio
+import os
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from .chunker import TextChunker
+from .document_service import DocumentService
+from .embeddings import EmbeddingService
+from .vector_store import VectorStore
+from .models import DocumentChunk, IndexStatus, UpsertBatchTiming
+
+# Tells a stage worker that its input queue is drained
+_DONE = object()
+
+
+@dataclass
+class IndexWorkItem:
+    document_id: str
+    text: str = ""
+    chunks: List[DocumentChunk] = field(default_factory=list)
+    new_chunks: List[DocumentChunk] = field(default_factory=list)
+    stale_ids: List[str] = field(default_factory=list)
+    embeddings: List[List[float]] = field(default_factory=list)
+
+
+@dataclass
+class IndexRun:
+    on_result: Optional[Callable[[IndexStatus], None]] = None
+    # Called with a document ID and updated chunk counters as the document moves through the stages
+    on_progress: Optional[Callable[[str, Dict[str, int]], None]] = None
+    results: Dict[str, IndexStatus] = field(default_factory=dict)
+    # Documents whose stored chunks may differ from before the run
+    changed_ids: Set[str] = field(default_factory=set)
+
+    def finish(self, status: IndexStatus):
+        self.results[status.document_id] = status
+        if status.status != "success":
+            self.changed_ids.add(status.document_id)
+        if self.on_result is not None:
+            self.on_result(status)
+
+    def progress(self, document_id: str, **counts: int):
+        if self.on_progress is not None:
+            self.on_progress(document_id, counts)
+
+
+StageHandler = Callable[[IndexRun, Any], Awaitable[List[Any]]]
+
+
+class IndexingPipeline:
+    # fetch -> chunk -> embed -> upsert, joined by bounded queues so a slow stage
+    # applies backpressure while the others keep working on other documents
+    def __init__(self, document_service: DocumentService, chunker: TextChunker,
+                 embedding_service: EmbeddingService, vector_store: VectorStore):
+        self.document_service = document_service
+        self.chunker = chunker
+        self.embedding_service = embedding_service
+        self.vector_store = vector_store
+        self.fetch_batch_size = int(os.getenv("INDEX_FETCH_BATCH_SIZE", "16"))
+        self.fetch_workers = int(os.getenv("INDEX_FETCH_CONCURRENCY", "2"))
+        self.chunk_workers = int(os.getenv("INDEX_CHUNK_CONCURRENCY", "4"))
+        self.embed_workers = int(os.getenv("INDEX_EMBED_CONCURRENCY", "2"))
+        self.upsert_workers = int(os.getenv("INDEX_UPSERT_CONCURRENCY", "2"))
+        self.queue_size = int(os.getenv("INDEX_QUEUE_SIZE", "8"))
+
+    async def run(self, document_ids: List[str],
+                  on_result: Optional[Callable[[IndexStatus], None]] = None,
+                  on_progress: Optional[Callable[[str, Dict[str, int]], None]] = None) -> IndexRun:
+        run = IndexRun(on_result=on_result, on_progress=on_progress)
+        unique_ids = list(dict.fromkeys(document_ids))
+
+        batches = asyncio.Queue()
+        for i in range(0, len(unique_ids), self.fetch_batch_size):
+            batches.put_nowait(unique_ids[i:i + self.fetch_batch_size])
+        for _ in range(self.fetch_workers):
+            batches.put_nowait(_DONE)
+        fetched = asyncio.Queue(maxsize=self.queue_size)
+        chunked = asyncio.Queue(maxsize=self.queue_size)
+        embedded = asyncio.Queue(maxsize=self.queue_size)
+
+        await asyncio.gather(
+            self._stage(run, batches, fetched, self.fetch_workers, self._fetch, self.chunk_workers),
+            self._stage(run, fetched, chunked, self.chunk_workers, self._chunk, self.embed_workers),
+            self._stage(run, chunked, embedded, self.embed_workers, self._embed, self.upsert_workers),
+            self._stage(run, embedded, None, self.upsert_workers, self._upsert, 0)
+        )
+        return run
+
+    async def _stage(self, run: IndexRun, inbox: asyncio.Queue, outbox: Optional[asyncio.Queue],
+                     workers: int, handler: StageHandler, downstream_workers: int):
+        async def worker():
+            while True:
+                item = await inbox.get()
+                if item is _DONE:
+                    return
+                try:
+                    outputs = await handler(run, item)
+                except Exception as e:
+                    # The fetch stage works on lists of document IDs, later stages on single documents
+                    for doc_id in item if isinstance(item, list) else [item.document_id]:
+                        run.finish(IndexStatus(document_id=doc_id, status="failed", message=str(e)))
+                    continue
+                for output in outputs:
+                    await outbox.put(output)
+
+        await asyncio.gather(*[worker() for _ in range(workers)])
+        for _ in range(downstream_workers):
+            await outbox.put(_DONE)
+
+    async def _fetch(self, run: IndexRun, document_ids: List[str]) -> List[IndexWorkItem]:
+        documents = await self.document_service.get_documents_text(document_ids)
+        items = []
+        for doc_id in document_ids:
+            text = documents.get(doc_id)
+            if not text:
+                run.finish(IndexStatus(document_id=doc_id, status="failed", message="Document not found or empty"))
+                continue
+            items.append(IndexWorkItem(document_id=doc_id, text=text))
+        return items
+
+    async def _chunk(self, run: IndexRun, item: IndexWorkItem) -> List[IndexWorkItem]:
+        item.chunks = await asyncio.to_thread(self.chunker.chunk_text, item.document_id, item.text)
+        item.text = ""
+        if not item.chunks:
+            run.finish(IndexStatus(document_id=item.document_id, status="failed", message="No chunks generated from document"))
+            return []
+
+        # Chunk IDs hash the chunk text, so only new or edited chunks need embedding
+        stored_ids = await self.vector_store.list_chunk_ids(item.document_id)
+        item.new_chunks = [chunk for chunk in item.chunks if chunk.chunk_id not in stored_ids]
+        item.stale_ids = sorted(stored_ids - {chunk.chunk_id for chunk in item.chunks})
+        if item.new_chunks or item.stale_ids:
+            run.changed_ids.add(item.document_id)
+        run.progress(item.document_id, chunks_total=len(item.chunks), chunks_to_embed=len(item.new_chunks))
+        return [item]
+
+    async def _embed(self, run: IndexRun, item: IndexWorkItem) -> List[IndexWorkItem]:
+        item.embeddings = await self.embedding_service.create_embeddings([chunk.text for chunk in item.new_chunks])
+        run.progress(item.document_id, chunks_embedded=len(item.new_chunks))
+        return [item]
+
+    async def _upsert(self, run: IndexRun, item: IndexWorkItem) -> List[IndexWorkItem]:
+        upsert_batches: List[UpsertBatchTiming] = []
+        if item.new_chunks:
+            upsert_batches = await self.vector_store.upsert_chunks(item.new_chunks, item.embeddings)
+            run.progress(item.document_id, chunks_upserted=len(item.new_chunks))
+        # Removed after the upsert so the document is never left without chunks
+        if item.stale_ids:
+            await self.vector_store.delete_chunks(item.document_id, item.stale_ids)
+        run.finish(IndexStatus(
+            document_id=item.document_id,
+            status="success",
+            message=f"Indexed {len(item.chunks)} chunks ({len(item.new_chunks)} new or changed, {len(item.stale_ids)} removed)",
+            upsert_batches=upsert_batches
+        ))
+        return []
@@ -0,0 +1,205 @@
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from .indexing import IndexRun
+from .models import IndexJobDocument, IndexJobStatus, IndexStatus
+
+FINISHED_STATUSES = {"completed", "failed", "cancelled"}
+
+IndexRunner = Callable[..., Awaitable[IndexRun]]
+
+
+class IndexJobNotFoundError(Exception):
+    pass
+
+
+class IndexJobFinishedError(Exception):
+    pass
+
+
+class IndexJobManager:
+    def __init__(self, runner: IndexRunner, jobs_dir: Optional[Path] = None, workers: Optional[int] = None):
+        self.runner = runner
+        # One checkpoint file per job, so saving a job never rewrites the others
+        self.jobs_dir = Path(jobs_dir or os.getenv("INDEX_JOBS_DIR", "./index_jobs"))
+        self.workers = workers or int(os.getenv("INDEX_JOB_WORKERS", "1"))
+        self.history = int(os.getenv("INDEX_JOB_HISTORY", "100"))
+        self.checkpoint_interval = float(os.getenv("INDEX_JOB_CHECKPOINT_INTERVAL", "1.0"))
+        self.jobs: Dict[str, IndexJobStatus] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        # Jobs with progress not yet checkpointed; flushed together every checkpoint interval
+        self._dirty: Set[str] = set()
+        self._save_lock = asyncio.Lock()
+        self._load()
+
+    def _job_path(self, job_id: str) -> Path:
+        return self.jobs_dir / f"{job_id}.json"
+
+    def _load(self):
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        jobs = {}
+        legacy_file = Path(os.getenv("INDEX_JOBS_FILE", "./index_jobs.json"))
+        if legacy_file.exists():
+            with open(legacy_file, 'r') as f:
+                legacy_jobs = [IndexJobStatus(**job) for job in json.load(f)]
+            for job in legacy_jobs:
+                jobs[job.job_id] = job
+                self._write(job.job_id, job.model_dump_json())
+            os.replace(legacy_file, legacy_file.with_suffix(".json.migrated"))
+            print(f"Migrated {len(legacy_jobs)} index jobs from {legacy_file} to {self.jobs_dir}")
+        for path in self.jobs_dir.glob("*.json"):
+            job = IndexJobStatus.model_validate_json(path.read_text())
+            jobs[job.job_id] = job
+        self.jobs = {job.job_id: job for job in sorted(jobs.values(), key=lambda job: job.created_at)}
+
+    def _write(self, job_id: str, data: str):
+        tmp_file = self.jobs_dir / f"{job_id}.json.tmp"
+        with open(tmp_file, 'w') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self._job_path(job_id))
+
+    def _remove_files(self, job_ids: List[str]):
+        for job_id in job_ids:
+            self._job_path(job_id).unlink(missing_ok=True)
+
+    async def _save(self, job: IndexJobStatus):
+        # Serialised so an older snapshot of a job can never overwrite a newer one
+        async with self._save_lock:
+            self._dirty.discard(job.job_id)
+            await asyncio.to_thread(self._write, job.job_id, job.model_dump_json())
+
+            if job.status in FINISHED_STATUSES:
+                # Keep every unfinished job and the most recent finished ones
+                finished = [job_id for job_id, other in self.jobs.items() if other.status in FINISHED_STATUSES]
+                expired = finished[:max(len(finished) - self.history, 0)]
+                for job_id in expired:
+                    del self.jobs[job_id]
+                    self._dirty.discard(job_id)
+                await asyncio.to_thread(self._remove_files, expired)
+
+    async def _flush(self):
+        for job_id in list(self._dirty):
+            job = self.jobs.get(job_id)
+            if job is not None:
+                await self._save(job)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            try:
+                await self._flush()
+            except Exception as e:
+                print(f"Failed to checkpoint index jobs: {str(e)}")
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._flush_periodically()))
+
+        # Resume jobs interrupted by a restart; documents already indexed are skipped
+        for job in self.jobs.values():
+            if job.status not in FINISHED_STATUSES:
+                job.status = "queued"
+                self._queue.put_nowait(job.job_id)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self._flush()
+
+    async def submit(self, document_ids: List[str]) -> IndexJobStatus:
+        now = datetime.now()
+        job = IndexJobStatus(
+            job_id=str(uuid.uuid4()),
+            status="queued",
+            created_at=now,
+            updated_at=now,
+            documents=[IndexJobDocument(document_id=doc_id) for doc_id in dict.fromkeys(document_ids)]
+        )
+        self.jobs[job.job_id] = job
+        await self._save(job)
+        self._queue.put_nowait(job.job_id)
+        return job
+
+    def get(self, job_id: str) -> IndexJobStatus:
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise IndexJobNotFoundError(f"Index job {job_id} not found")
+        return job
+
+    async def cancel(self, job_id: str) -> IndexJobStatus:
+        job = self.get(job_id)
+        if job.status in FINISHED_STATUSES:
+            raise IndexJobFinishedError(f"Index job {job_id} is already {job.status}")
+        job.status = "cancelled"
+        job.updated_at = datetime.now()
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+        await self._save(job)
+        return job
+
+    def pending_count(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            job = self.jobs.get(job_id)
+            if job is None or job.status != "queued":
+                continue
+            task = asyncio.create_task(self._run(job))
+            self._running[job_id] = task
+            try:
+                await task
+            except asyncio.CancelledError:
+                # Shutdown cancels the worker and leaves the job running so it resumes on restart;
+                # a cancelled job only stops its own task
+                if asyncio.current_task().cancelling():
+                    raise
+            except Exception as e:
+                print(f"Index job {job_id} failed unexpectedly: {str(e)}")
+            finally:
+                self._running.pop(job_id, None)
+
+    async def _run(self, job: IndexJobStatus):
+        documents = {document.document_id: document for document in job.documents}
+        job.status = "running"
+        job.updated_at = datetime.now()
+        await self._save(job)
+
+        def on_progress(document_id: str, counts: Dict[str, int]):
+            for name, value in counts.items():
+                setattr(documents[document_id], name, value)
+            job.updated_at = datetime.now()
+            self._dirty.add(job.job_id)
+
+        def on_result(status: IndexStatus):
+            document = documents[status.document_id]
+            document.status = status.status
+            document.message = status.message
+            job.updated_at = datetime.now()
+            # Checkpointed with the next flush: finished documents are not indexed again after
+            # a restart, and those finished just before a crash are cheap to redo incrementally
+            self._dirty.add(job.job_id)
+
+        pending = [doc_id for doc_id, document in documents.items() if document.status != "success"]
+        try:
+            await self.runner(pending, on_result=on_result, on_progress=on_progress)
+            job.status = "completed"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        job.updated_at = datetime.now()
+        await self._save(job)
@@ -1,22 +1,21 @@
 import os
-from typing import List, Dict, Any, Tuple
-from openai import OpenAI
+from typing import AsyncIterator, List, Dict, Any, Tuple, Union
+from openai import AsyncOpenAI
 
 
 class LLMService:
     def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
         self.model = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
         self.max_tokens = int(os.getenv("MAX_TOKENS", "1000"))
         self.temperature = float(os.getenv("TEMPERATURE", "0.7"))
 
-    async def generate_answer(
-        self, 
-        question: str, 
-        context_chunks: List[Dict[str, Any]]
-    ) -> Tuple[str, int, int, float]:
+    async def close(self):
+        await self.client.close()
+
+    def _build_messages(self, question: str, context_chunks: List[Dict[str, Any]]) -> List[Dict[str, str]]:
         context = "\n\n".join([
-            f"Document {chunk['document_id']} (chunk {chunk['chunk_index']}):\n{chunk['text']}"
+            f"Document {chunk['document_id']} ({self._chunk_label(chunk)}):\n{chunk['text']}"
             for chunk in context_chunks
         ])
 
@@ -31,13 +30,27 @@ Question: {question}
 
 Please provide a comprehensive answer based on the context above."""
 
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    @staticmethod
+    def _chunk_label(chunk: Dict[str, Any]) -> str:
+        last_index = chunk.get('last_chunk_index', chunk['chunk_index'])
+        if last_index != chunk['chunk_index']:
+            return f"chunks {chunk['chunk_index']}-{last_index}"
+        return f"chunk {chunk['chunk_index']}"
+
+    async def generate_answer(
+        self, 
+        question: str, 
+        context_chunks: List[Dict[str, Any]]
+    ) -> Tuple[str, int, int, float]:
         try:
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
+                messages=self._build_messages(question, context_chunks),
                 max_tokens=self.max_tokens,
                 temperature=self.temperature
             )
@@ -53,6 +66,37 @@ Please provide a comprehensive answer based on the context above."""
         except Exception as e:
             raise ValueError(f"Failed to generate answer: {str(e)}")
 
+    async def stream_answer(
+        self,
+        question: str,
+        context_chunks: List[Dict[str, Any]]
+    ) -> AsyncIterator[Union[str, Tuple[str, int, int, float]]]:
+        # Yields answer text deltas as they arrive, then one (answer, tokens consumed,
+        # tokens generated, confidence) tuple once the completion has finished
+        try:
+            stream = await self.client.chat.completions.create(
+                model=self.model,
+                messages=self._build_messages(question, context_chunks),
+                max_tokens=self.max_tokens,
+                temperature=self.temperature,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            parts = []
+            tokens_consumed = tokens_generated = 0
+            async for event in stream:
+                if event.usage is not None:
+                    tokens_consumed = event.usage.prompt_tokens
+                    tokens_generated = event.usage.completion_tokens
+                if event.choices and event.choices[0].delta.content:
+                    parts.append(event.choices[0].delta.content)
+                    yield event.choices[0].delta.content
+        except Exception as e:
+            raise ValueError(f"Failed to generate answer: {str(e)}")
+
+        answer = "".join(parts)
+        yield answer, tokens_consumed, tokens_generated, self._calculate_confidence(answer, context_chunks)
+
     def _calculate_confidence(self, answer: str, context_chunks: List[Dict[str, Any]]) -> float:
         if not answer or "don't have enough information" in answer.lower():
             return 0.3
@@ -1,73 +1,97 @@
+import asyncio
+import json
 import os
 import time
 import uuid
-from typing import List
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Tuple
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 
 from .models import (
-    IndexRequest, IndexResponse, IndexStatus,
+    IndexRequest, IndexResponse, IndexJobStatus,
     QueryRequest, QueryResponse, MetricsPayload
 )
 from .chunker import TextChunker
 from .embeddings import EmbeddingService
-from .vector_store import VectorStore
+from .vector_store import create_vector_store
 from .llm_service import LLMService
 from .metrics_client import MetricsClient
 from .document_service import DocumentService
-
-app = FastAPI(title="RAG Module", version="1.0.0")
+from .answer_cache import AnswerCache
+from .context_builder import ContextBuilder
+from .indexing import IndexingPipeline, IndexRun
+from .jobs import IndexJobManager, IndexJobNotFoundError, IndexJobFinishedError
 
 chunker = TextChunker()
 embedding_service = EmbeddingService()
-vector_store = VectorStore()
+vector_store = create_vector_store(os.getenv("VECTOR_STORE_BACKEND", "pinecone"))
 llm_service = LLMService()
 metrics_client = MetricsClient()
 document_service = DocumentService()
+answer_cache = AnswerCache()
+context_builder = ContextBuilder()
+indexing_pipeline = IndexingPipeline(document_service, chunker, embedding_service, vector_store)
+
+
+async def run_indexing(document_ids: List[str], on_result=None, on_progress=None) -> IndexRun:
+    try:
+        run = await indexing_pipeline.run(document_ids, on_result=on_result, on_progress=on_progress)
+    except BaseException:
+        # An interrupted run may have changed any of its documents
+        answer_cache.invalidate_documents(document_ids)
+        raise
+    # Cached answers may quote chunks that were just replaced
+    answer_cache.invalidate_documents(list(run.changed_ids))
+    return run
+
+
+index_jobs = IndexJobManager(run_indexing)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await document_service.start()
+    await metrics_client.start()
+    await index_jobs.start()
+    yield
+    await index_jobs.stop()
+    await metrics_client.close()
+    await document_service.close()
+    await embedding_service.close()
+    await llm_service.close()
+
+
+app = FastAPI(title="RAG Module", version="1.0.0", lifespan=lifespan)
 
 
 @app.post("/rag/index", response_model=IndexResponse)
 async def index_documents(request: IndexRequest):
-    results = []
-    
-    for doc_id in request.document_ids:
-        try:
-            text = await document_service.get_document_text(doc_id)
-            if not text:
-                results.append(IndexStatus(
-                    document_id=doc_id,
-                    status="failed",
-                    message="Document not found or empty"
-                ))
-                continue
-
-            chunks = chunker.chunk_text(doc_id, text)
-            if not chunks:
-                results.append(IndexStatus(
-                    document_id=doc_id,
-                    status="failed",
-                    message="No chunks generated from document"
-                ))
-                continue
-
-            chunk_texts = [chunk.text for chunk in chunks]
-            embeddings = await embedding_service.create_embeddings(chunk_texts)
-            
-            await vector_store.upsert_chunks(chunks, embeddings)
-            
-            results.append(IndexStatus(
-                document_id=doc_id,
-                status="success",
-                message=f"Indexed {len(chunks)} chunks"
-            ))
+    run = await run_indexing(request.document_ids)
+    return IndexResponse(results=[run.results[doc_id] for doc_id in request.document_ids])
 
-        except Exception as e:
-            results.append(IndexStatus(
-                document_id=doc_id,
-                status="failed",
-                message=str(e)
-            ))
 
-    return IndexResponse(results=results)
+@app.post("/rag/index/jobs", response_model=IndexJobStatus, status_code=202)
+async def create_index_job(request: IndexRequest):
+    return await index_jobs.submit(request.document_ids)
+
+
+@app.get("/rag/index/jobs/{job_id}", response_model=IndexJobStatus)
+async def get_index_job(job_id: str):
+    try:
+        return index_jobs.get(job_id)
+    except IndexJobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@app.post("/rag/index/jobs/{job_id}/cancel", response_model=IndexJobStatus)
+async def cancel_index_job(job_id: str):
+    try:
+        return await index_jobs.cancel(job_id)
+    except IndexJobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except IndexJobFinishedError as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
 
 @app.post("/rag/query", response_model=QueryResponse)
@@ -77,7 +101,28 @@ async def query_documents(request: QueryRequest):
 
     try:
         query_embedding = await embedding_service.create_embedding(request.question)
-        
+
+        cached = answer_cache.lookup(request.document_ids, query_embedding)
+        if cached is not None:
+            response_time_ms = int((time.time() - start_time) * 1000)
+            await metrics_client.send_metrics(MetricsPayload(
+                run_id=run_id,
+                tokens_consumed=0,
+                tokens_generated=0,
+                response_time_ms=response_time_ms,
+                confidence_score=cached.confidence_score,
+                status="success",
+                cache_hit=True
+            ))
+            return cached.model_copy(update={
+                "run_id": run_id,
+                "tokens_consumed": 0,
+                "tokens_generated": 0,
+                "response_time_ms": response_time_ms,
+                "cache_hit": True
+            })
+
+        cache_snapshot = answer_cache.snapshot(request.document_ids)
         similar_chunks = await vector_store.query_similar_chunks(
             query_embedding=query_embedding,
             document_ids=request.document_ids
@@ -89,9 +134,11 @@ async def query_documents(request: QueryRequest):
                 detail="No relevant content found for the given question and documents"
             )
 
+        # Overlapping chunks are merged and the rest packed by score into the token budget
+        packed = await asyncio.to_thread(context_builder.build, similar_chunks)
         answer, tokens_consumed, tokens_generated, confidence_score = await llm_service.generate_answer(
             question=request.question,
-            context_chunks=similar_chunks
+            context_chunks=packed.segments
         )
 
         response_time_ms = int((time.time() - start_time) * 1000)
@@ -102,19 +149,25 @@ async def query_documents(request: QueryRequest):
             tokens_generated=tokens_generated,
             response_time_ms=response_time_ms,
             confidence_score=confidence_score,
-            status="success"
+            status="success",
+            context_tokens=packed.packed_tokens,
+            context_tokens_saved=packed.tokens_saved
         )
 
         await metrics_client.send_metrics(metrics)
 
-        return QueryResponse(
+        response = QueryResponse(
             run_id=run_id,
             answer=answer,
             tokens_consumed=tokens_consumed,
             tokens_generated=tokens_generated,
             response_time_ms=response_time_ms,
-            confidence_score=confidence_score
+            confidence_score=confidence_score,
+            context_tokens=packed.packed_tokens,
+            context_tokens_saved=packed.tokens_saved
         )
+        answer_cache.put(request.document_ids, query_embedding, response, cache_snapshot)
+        return response
 
     except HTTPException:
         raise
@@ -135,6 +188,154 @@ async def query_documents(request: QueryRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def ndjson_line(record: dict) -> str:
+    return json.dumps(record) + "\n"
+
+
+async def stream_answer_events(
+    request: QueryRequest,
+    run_id: str,
+    start_time: float,
+    query_embedding: List[float],
+    cached: Optional[QueryResponse],
+    similar_chunks: List[Dict[str, Any]],
+    cache_snapshot: Tuple[int, ...]
+):
+    def elapsed_ms() -> int:
+        return int((time.time() - start_time) * 1000)
+
+    if cached is not None:
+        time_to_first_token_ms = elapsed_ms()
+        yield ndjson_line({"type": "token", "text": cached.answer})
+        metrics = MetricsPayload(
+            run_id=run_id,
+            tokens_consumed=0,
+            tokens_generated=0,
+            response_time_ms=elapsed_ms(),
+            confidence_score=cached.confidence_score,
+            status="success",
+            cache_hit=True,
+            time_to_first_token_ms=time_to_first_token_ms
+        )
+        await metrics_client.send_metrics(metrics)
+        yield ndjson_line({"type": "done", **metrics.model_dump()})
+        return
+
+    # Tokenizing may load the tiktoken encoding on first use, so it stays off the event loop
+    packed = await asyncio.to_thread(context_builder.build, similar_chunks)
+    yield ndjson_line({
+        "type": "retrieval",
+        "run_id": run_id,
+        "chunks": [
+            {"document_id": chunk["document_id"], "chunk_index": chunk["chunk_index"], "score": chunk["score"]}
+            for chunk in similar_chunks
+        ],
+        "context_tokens": packed.packed_tokens,
+        "context_tokens_saved": packed.tokens_saved
+    })
+
+    time_to_first_token_ms = None
+    try:
+        async for event in llm_service.stream_answer(request.question, packed.segments):
+            if isinstance(event, str):
+                if time_to_first_token_ms is None:
+                    time_to_first_token_ms = elapsed_ms()
+                yield ndjson_line({"type": "token", "text": event})
+            else:
+                answer, tokens_consumed, tokens_generated, confidence_score = event
+    except Exception as e:
+        await metrics_client.send_metrics(MetricsPayload(
+            run_id=run_id,
+            tokens_consumed=0,
+            tokens_generated=0,
+            response_time_ms=elapsed_ms(),
+            confidence_score=0.0,
+            status="failed",
+            time_to_first_token_ms=time_to_first_token_ms,
+            context_tokens=packed.packed_tokens
+        ))
+        yield ndjson_line({"type": "error", "run_id": run_id, "detail": str(e)})
+        return
+
+    metrics = MetricsPayload(
+        run_id=run_id,
+        tokens_consumed=tokens_consumed,
+        tokens_generated=tokens_generated,
+        response_time_ms=elapsed_ms(),
+        confidence_score=confidence_score,
+        status="success",
+        time_to_first_token_ms=time_to_first_token_ms,
+        context_tokens=packed.packed_tokens,
+        context_tokens_saved=packed.tokens_saved
+    )
+    await metrics_client.send_metrics(metrics)
+    answer_cache.put(request.document_ids, query_embedding, QueryResponse(
+        run_id=run_id,
+        answer=answer,
+        tokens_consumed=tokens_consumed,
+        tokens_generated=tokens_generated,
+        response_time_ms=metrics.response_time_ms,
+        confidence_score=confidence_score,
+        context_tokens=packed.packed_tokens,
+        context_tokens_saved=packed.tokens_saved
+    ), cache_snapshot)
+    yield ndjson_line({"type": "done", **metrics.model_dump()})
+
+
+@app.post("/rag/query/stream")
+async def stream_query_documents(request: QueryRequest):
+    start_time = time.time()
+    run_id = str(uuid.uuid4())
+    similar_chunks: List[Dict[str, Any]] = []
+    cache_snapshot: Tuple[int, ...] = ()
+
+    try:
+        query_embedding = await embedding_service.create_embedding(request.question)
+        cached = answer_cache.lookup(request.document_ids, query_embedding)
+        if cached is None:
+            cache_snapshot = answer_cache.snapshot(request.document_ids)
+            similar_chunks = await vector_store.query_similar_chunks(
+                query_embedding=query_embedding,
+                document_ids=request.document_ids
+            )
+    except Exception as e:
+        await metrics_client.send_metrics(MetricsPayload(
+            run_id=run_id,
+            tokens_consumed=0,
+            tokens_generated=0,
+            response_time_ms=int((time.time() - start_time) * 1000),
+            confidence_score=0.0,
+            status="failed"
+        ))
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if cached is None and not similar_chunks:
+        raise HTTPException(
+            status_code=404,
+            detail="No relevant content found for the given question and documents"
+        )
+
+    # Retrieval results go out first, then answer tokens as the model produces them,
+    # then a final event carrying the metrics payload
+    return StreamingResponse(
+        stream_answer_events(request, run_id, start_time, query_embedding, cached, similar_chunks, cache_snapshot),
+        media_type="application/x-ndjson"
+    )
+
+
+@app.get("/rag/stats")
+async def get_stats():
+    return {
+        "embeddings": embedding_service.stats(),
+        "answers": answer_cache.stats(),
+        "pending_index_jobs": index_jobs.pending_count(),
+        "http": {
+            "pdf_service": document_service.http.stats(),
+            "metrics": metrics_client.http.stats()
+        }
+    }
+
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "rag_module"}
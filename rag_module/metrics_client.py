@@ -1,13 +1,20 @@
 import os
-import httpx
 from typing import Optional
 from .models import MetricsPayload
+from .http_pool import HTTPPool
 
 
 class MetricsClient:
     def __init__(self):
         self.metrics_url = os.getenv("METRICS_LAMBDA_URL")
         self.timeout = float(os.getenv("METRICS_TIMEOUT", "30.0"))
+        self.http = HTTPPool("metrics", self.timeout)
+
+    async def start(self):
+        await self.http.start()
+
+    async def close(self):
+        await self.http.close()
 
     async def send_metrics(self, metrics: MetricsPayload) -> bool:
         if not self.metrics_url:
@@ -15,13 +22,12 @@ class MetricsClient:
             return False
 
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    self.metrics_url,
-                    json=metrics.model_dump()
-                )
-                response.raise_for_status()
-                return True
+            response = await self.http.post(
+                self.metrics_url,
+                json=metrics.model_dump()
+            )
+            response.raise_for_status()
+            return True
         except Exception as e:
             print(f"Failed to send metrics: {str(e)}")
-            return False
\ No newline at end of file
+            return False
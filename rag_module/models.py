@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import List, Optional
 from pydantic import BaseModel, Field
 
@@ -6,16 +7,43 @@ class IndexRequest(BaseModel):
     document_ids: List[str] = Field(..., description="List of document IDs to index")
 
 
+class UpsertBatchTiming(BaseModel):
+    vectors: int
+    bytes: int
+    attempts: int
+    duration_ms: float
+
+
 class IndexStatus(BaseModel):
     document_id: str
     status: str
     message: Optional[str] = None
+    upsert_batches: Optional[List[UpsertBatchTiming]] = None
 
 
 class IndexResponse(BaseModel):
     results: List[IndexStatus]
 
 
+class IndexJobDocument(BaseModel):
+    document_id: str
+    status: str = "pending"
+    message: Optional[str] = None
+    chunks_total: int = 0
+    chunks_to_embed: int = 0
+    chunks_embedded: int = 0
+    chunks_upserted: int = 0
+
+
+class IndexJobStatus(BaseModel):
+    job_id: str
+    status: str
+    created_at: datetime
+    updated_at: datetime
+    documents: List[IndexJobDocument]
+    error: Optional[str] = None
+
+
 class QueryRequest(BaseModel):
     document_ids: List[str] = Field(..., description="List of document IDs to query")
     question: str = Field(..., description="The question to answer")
@@ -28,6 +56,9 @@ class QueryResponse(BaseModel):
     tokens_generated: int
     response_time_ms: int
     confidence_score: float
+    cache_hit: bool = False
+    context_tokens: Optional[int] = None
+    context_tokens_saved: Optional[int] = None
 
 
 class DocumentChunk(BaseModel):
@@ -46,4 +77,8 @@ class MetricsPayload(BaseModel):
     tokens_generated: int
     response_time_ms: int
     confidence_score: float
-    status: str
\ No newline at end of file
+    status: str
+    cache_hit: bool = False
+    time_to_first_token_ms: Optional[int] = None
+    context_tokens: Optional[int] = None
+    context_tokens_saved: Optional[int] = None
\ No newline at end of file
@@ -0,0 +1,47 @@
+import threading
+from typing import List
+
+import tiktoken
+
+# Rough size of a token in characters, used when the tiktoken encoding cannot be loaded
+CHARS_PER_TOKEN = 4
+
+
+class TokenCounter:
+    def __init__(self, model: str):
+        self.model = model
+        self._encoding = None
+        self._encoding_loaded = False
+        self._load_lock = threading.Lock()
+
+    def _get_encoding(self):
+        # Loaded on first use; tiktoken may need to download the encoding, so callers
+        # on the event loop go through a thread
+        with self._load_lock:
+            if not self._encoding_loaded:
+                try:
+                    self._encoding = tiktoken.encoding_for_model(self.model)
+                except Exception:
+                    try:
+                        self._encoding = tiktoken.get_encoding("cl100k_base")
+                    except Exception as e:
+                        print(f"Warning: tiktoken encoding unavailable, estimating token counts: {str(e)}")
+                self._encoding_loaded = True
+        return self._encoding
+
+    def count_many(self, texts: List[str]) -> List[int]:
+        encoding = self._get_encoding()
+        if encoding is None:
+            return [len(text) // CHARS_PER_TOKEN + 1 for text in texts]
+        return [len(tokens) for tokens in encoding.encode_ordinary_batch(texts)]
+
+    def count(self, text: str) -> int:
+        return self.count_many([text])[0]
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if max_tokens <= 0:
+            return ""
+        encoding = self._get_encoding()
+        if encoding is None:
+            return text[:max_tokens * CHARS_PER_TOKEN]
+        return encoding.decode(encoding.encode_ordinary(text)[:max_tokens])
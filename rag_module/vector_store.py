@@ -1,10 +1,43 @@
+import asyncio
+import base64
+import json
 import os
-from typing import List, Dict, Any
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+import numpy as np
 from pinecone import Pinecone, ServerlessSpec
-from .models import DocumentChunk
+from .models import DocumentChunk, UpsertBatchTiming
 
 
 class VectorStore:
+    async def upsert_chunks(self, chunks: List[DocumentChunk], embeddings: List[List[float]]) -> List[UpsertBatchTiming]:
+        raise NotImplementedError
+
+    async def query_similar_chunks(
+        self,
+        query_embedding: List[float],
+        document_ids: List[str],
+        top_k: int = None
+    ) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def list_chunk_ids(self, document_id: str) -> Set[str]:
+        raise NotImplementedError
+
+    async def delete_chunks(self, document_id: str, chunk_ids: List[str]):
+        raise NotImplementedError
+
+    async def delete_document_chunks(self, document_id: str):
+        raise NotImplementedError
+
+
+class PineconeVectorStore(VectorStore):
     def __init__(self):
         self.pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
         self.index_name = os.getenv("PINECONE_INDEX", "vector")
@@ -12,6 +45,12 @@ class VectorStore:
         self.metric = os.getenv("PINECONE_METRIC", "cosine")
         self.cloud = os.getenv("PINECONE_CLOUD", "aws")
         self.region = os.getenv("PINECONE_REGION", "us-east-1")
+        # Pinecone rejects upsert requests over 2 MB or 1000 vectors
+        self.upsert_max_bytes = int(os.getenv("PINECONE_UPSERT_MAX_BYTES", "1800000"))
+        self.upsert_max_vectors = int(os.getenv("PINECONE_UPSERT_MAX_VECTORS", "500"))
+        self.upsert_concurrency = int(os.getenv("PINECONE_UPSERT_CONCURRENCY", "4"))
+        self.upsert_retries = int(os.getenv("PINECONE_UPSERT_RETRIES", "3"))
+        self.upsert_backoff = float(os.getenv("PINECONE_UPSERT_BACKOFF", "0.5"))
         
         self._ensure_index_exists()
         self.index = self.pc.Index(self.index_name)
@@ -30,11 +69,25 @@ class VectorStore:
                 )
             )
 
-    async def upsert_chunks(self, chunks: List[DocumentChunk], embeddings: List[List[float]]):
+    async def upsert_chunks(self, chunks: List[DocumentChunk], embeddings: List[List[float]]) -> List[UpsertBatchTiming]:
         if len(chunks) != len(embeddings):
             raise ValueError("Number of chunks must match number of embeddings")
 
-        vectors = []
+        batches = await asyncio.to_thread(self._plan_upsert_batches, chunks, embeddings)
+        semaphore = asyncio.Semaphore(self.upsert_concurrency)
+
+        async def upsert(batch: Tuple[List[Dict[str, Any]], int]) -> UpsertBatchTiming:
+            async with semaphore:
+                return await self._upsert_batch(*batch)
+
+        return list(await asyncio.gather(*[upsert(batch) for batch in batches]))
+
+    def _plan_upsert_batches(
+        self, chunks: List[DocumentChunk], embeddings: List[List[float]]
+    ) -> List[Tuple[List[Dict[str, Any]], int]]:
+        batches = []
+        batch: List[Dict[str, Any]] = []
+        batch_bytes = 0
         for chunk, embedding in zip(chunks, embeddings):
             vector = {
                 'id': chunk.chunk_id,
@@ -47,12 +100,39 @@ class VectorStore:
                     'end_char': chunk.end_char
                 }
             }
-            vectors.append(vector)
+            size = len(json.dumps(vector).encode("utf-8"))
+            if batch and (batch_bytes + size > self.upsert_max_bytes or len(batch) >= self.upsert_max_vectors):
+                batches.append((batch, batch_bytes))
+                batch, batch_bytes = [], 0
+            batch.append(vector)
+            batch_bytes += size
+        if batch:
+            batches.append((batch, batch_bytes))
+        return batches
 
-        batch_size = 100
-        for i in range(0, len(vectors), batch_size):
-            batch = vectors[i:i + batch_size]
-            self.index.upsert(vectors=batch)
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        status = getattr(error, "status", None) or getattr(error, "status_code", None)
+        return status is None or status == 429 or status >= 500
+
+    async def _upsert_batch(self, vectors: List[Dict[str, Any]], size: int) -> UpsertBatchTiming:
+        start_time = time.perf_counter()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                await asyncio.to_thread(self.index.upsert, vectors=vectors)
+                break
+            except Exception as e:
+                if attempt > self.upsert_retries or not self._is_retryable(e):
+                    raise
+                await asyncio.sleep(random.uniform(0, self.upsert_backoff * 2 ** attempt))
+        return UpsertBatchTiming(
+            vectors=len(vectors),
+            bytes=size,
+            attempts=attempt,
+            duration_ms=round((time.perf_counter() - start_time) * 1000, 1)
+        )
 
     async def query_similar_chunks(
         self, 
@@ -78,10 +158,275 @@ class VectorStore:
                 'score': match.score,
                 'text': match.metadata.get('text', ''),
                 'document_id': match.metadata.get('document_id', ''),
-                'chunk_index': match.metadata.get('chunk_index', 0)
+                'chunk_index': match.metadata.get('chunk_index', 0),
+                'start_char': match.metadata.get('start_char'),
+                'end_char': match.metadata.get('end_char')
             }
             for match in response.matches
         ]
 
+    def _list_chunk_ids(self, document_id: str) -> Set[str]:
+        chunk_ids = set()
+        for page in self.index.list(prefix=f"{document_id}#"):
+            # Older clients yield lists of IDs, newer ones ListResponse pages
+            items = page.vectors if hasattr(page, "vectors") else page
+            chunk_ids.update(item if isinstance(item, str) else item.id for item in items)
+        return chunk_ids
+
+    async def list_chunk_ids(self, document_id: str) -> Set[str]:
+        return await asyncio.to_thread(self._list_chunk_ids, document_id)
+
+    async def delete_chunks(self, document_id: str, chunk_ids: List[str]):
+        batch_size = 1000
+        for i in range(0, len(chunk_ids), batch_size):
+            await asyncio.to_thread(self.index.delete, ids=chunk_ids[i:i + batch_size])
+
+    async def delete_document_chunks(self, document_id: str):
+        self.index.delete(filter={"document_id": document_id})
+
+
+class LocalVectorStore(VectorStore):
+    # One partition per document: <name>.json holds the chunk records and names the matrix file
+    # <name>.<version>.npy with their unit-length float32 embeddings in the same row order
+    # (memory-mapped on read). <name> encodes the document ID
+    def __init__(self, index_dir: Optional[Path] = None):
+        self.index_dir = Path(index_dir or os.getenv("VECTOR_STORE_DIR", "./vector_index"))
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.dimension = int(os.getenv("EMBEDDING_DIMENSION", "1536"))
+        # LRU of loaded partitions bounded by the size of their chunk records; the matrices
+        # are memory-mapped, so the OS pages them in and out on its own
+        self.cache_max_bytes = int(os.getenv("VECTOR_STORE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+        self._partitions: "OrderedDict[str, Tuple[np.ndarray, List[Dict[str, Any]], int]]" = OrderedDict()
+        self._cached_bytes = 0
+        # Bumped on every write so a load that raced with it is not cached
+        self._generations: Dict[str, int] = {}
+        self._cache_lock = threading.Lock()
+        self._write_locks: Dict[str, threading.Lock] = {}
+
+    @staticmethod
+    def _partition_name(document_id: str) -> str:
+        return base64.urlsafe_b64encode(document_id.encode("utf-8")).decode("ascii").rstrip("=")
+
+    def _records_path(self, document_id: str) -> Path:
+        return self.index_dir / f"{self._partition_name(document_id)}.json"
+
+    def _matrix_paths(self, document_id: str) -> List[Path]:
+        # Every matrix version of the partition, including <name>.npy from before versioning
+        return list(self.index_dir.glob(f"{self._partition_name(document_id)}.*npy"))
+
+    def _read_partition(self, document_id: str) -> Optional[Tuple[np.ndarray, List[Dict[str, Any]], int]]:
+        # The records file is the single commit point of a write and names the matrix it pairs
+        # with, so a reader never mixes versions; a matrix removed under it means a newer one
+        # was just published, so the records are read again
+        records_path = self._records_path(document_id)
+        for _ in range(3):
+            try:
+                with open(records_path, 'r') as f:
+                    data = f.read()
+                partition = json.loads(data)
+                if isinstance(partition, list):
+                    matrix_path, records = records_path.with_suffix(".npy"), partition
+                else:
+                    matrix_path, records = self.index_dir / partition['matrix'], partition['records']
+                matrix = np.load(matrix_path, mmap_mode="r")
+            except FileNotFoundError:
+                if not records_path.exists():
+                    return None
+                continue
+            if matrix.shape[0] == len(records):
+                return matrix, records, len(data)
+        raise ValueError(f"Vector index partition of document {document_id} is inconsistent")
+
+    def _load_partition(self, document_id: str) -> Optional[Tuple[np.ndarray, List[Dict[str, Any]]]]:
+        with self._cache_lock:
+            cached = self._partitions.get(document_id)
+            if cached is not None:
+                self._partitions.move_to_end(document_id)
+                return cached[0], cached[1]
+            generation = self._generations.get(document_id, 0)
+
+        partition = self._read_partition(document_id)
+        if partition is None:
+            return None
+        matrix, records, size = partition
+
+        with self._cache_lock:
+            if generation == self._generations.get(document_id, 0) and size <= self.cache_max_bytes:
+                self._forget(document_id)
+                self._partitions[document_id] = (matrix, records, size)
+                self._cached_bytes += size
+                while self._cached_bytes > self.cache_max_bytes:
+                    _, (_, _, evicted_size) = self._partitions.popitem(last=False)
+                    self._cached_bytes -= evicted_size
+        return matrix, records
+
+    def _forget(self, document_id: str):
+        entry = self._partitions.pop(document_id, None)
+        if entry is not None:
+            self._cached_bytes -= entry[2]
+
+    def _invalidate(self, document_id: str):
+        with self._cache_lock:
+            self._forget(document_id)
+            self._generations[document_id] = self._generations.get(document_id, 0) + 1
+
+    def _write_lock(self, document_id: str) -> threading.Lock:
+        # Serialises read-modify-write of one partition
+        with self._cache_lock:
+            return self._write_locks.setdefault(document_id, threading.Lock())
+
+    def _write_partition(self, document_id: str, matrix: np.ndarray, records: List[Dict[str, Any]]):
+        records_path = self._records_path(document_id)
+        previous = self._matrix_paths(document_id)
+        matrix_name = f"{self._partition_name(document_id)}.{uuid.uuid4().hex}.npy"
+        with open(self.index_dir / matrix_name, 'wb') as f:
+            np.save(f, matrix)
+        tmp_records = records_path.with_suffix(".json.tmp")
+        with open(tmp_records, 'w') as f:
+            json.dump({'matrix': matrix_name, 'records': records}, f)
+        # Publishes matrix and records together
+        os.replace(tmp_records, records_path)
+        self._invalidate(document_id)
+        for path in previous:
+            path.unlink(missing_ok=True)
+
+    def _normalize(self, vectors: np.ndarray) -> np.ndarray:
+        if vectors.shape[-1] != self.dimension:
+            raise ValueError(f"Expected embeddings of dimension {self.dimension}, got {vectors.shape[-1]}")
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    async def upsert_chunks(self, chunks: List[DocumentChunk], embeddings: List[List[float]]) -> List[UpsertBatchTiming]:
+        if len(chunks) != len(embeddings):
+            raise ValueError("Number of chunks must match number of embeddings")
+        if not chunks:
+            return []
+        # Copying the matrix and writing the files would otherwise block the event loop
+        return await asyncio.to_thread(self._upsert_chunks, chunks, embeddings)
+
+    def _upsert_chunks(self, chunks: List[DocumentChunk], embeddings: List[List[float]]) -> List[UpsertBatchTiming]:
+        start_time = time.perf_counter()
+        vectors = self._normalize(np.asarray(embeddings, dtype=np.float32))
+        by_document: Dict[str, List[int]] = {}
+        for i, chunk in enumerate(chunks):
+            by_document.setdefault(chunk.document_id, []).append(i)
+
+        for document_id, rows in by_document.items():
+            with self._write_lock(document_id):
+                partition = self._load_partition(document_id)
+                matrix = np.array(partition[0]) if partition else np.empty((0, self.dimension), dtype=np.float32)
+                records = list(partition[1]) if partition else []
+                positions = {record['id']: i for i, record in enumerate(records)}
+                appended = []
+                for row in rows:
+                    chunk = chunks[row]
+                    record = {
+                        'id': chunk.chunk_id,
+                        'text': chunk.text,
+                        'chunk_index': chunk.chunk_index,
+                        'start_char': chunk.start_char,
+                        'end_char': chunk.end_char
+                    }
+                    if chunk.chunk_id in positions:
+                        matrix[positions[chunk.chunk_id]] = vectors[row]
+                        records[positions[chunk.chunk_id]] = record
+                    else:
+                        positions[chunk.chunk_id] = len(records)
+                        records.append(record)
+                        appended.append(row)
+                if appended:
+                    matrix = np.vstack([matrix, vectors[appended]])
+                self._write_partition(document_id, matrix, records)
+        return [UpsertBatchTiming(
+            vectors=len(chunks),
+            bytes=vectors.nbytes,
+            attempts=1,
+            duration_ms=round((time.perf_counter() - start_time) * 1000, 1)
+        )]
+
+    async def query_similar_chunks(
+        self,
+        query_embedding: List[float],
+        document_ids: List[str],
+        top_k: int = None
+    ) -> List[Dict[str, Any]]:
+        top_k = top_k or int(os.getenv("TOP_K", "5"))
+        # Partitions missing from the cache are read from disk
+        return await asyncio.to_thread(self._query_similar_chunks, query_embedding, document_ids, top_k)
+
+    def _query_similar_chunks(self, query_embedding: List[float], document_ids: List[str], top_k: int) -> List[Dict[str, Any]]:
+        query = self._normalize(np.asarray(query_embedding, dtype=np.float32))
+        if not document_ids:
+            document_ids = self._all_document_ids()
+
+        candidates = []
+        for document_id in dict.fromkeys(document_ids):
+            partition = self._load_partition(document_id)
+            if partition is None or not partition[1]:
+                continue
+            matrix, records = partition
+            scores = matrix @ query
+            # Only each partition's own top k can make the overall top k
+            if len(scores) > top_k:
+                rows = np.argpartition(scores, -top_k)[-top_k:]
+            else:
+                rows = np.arange(len(scores))
+            candidates.extend((float(scores[row]), document_id, records[row]) for row in rows)
+
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        return [
+            {
+                'id': record['id'],
+                'score': score,
+                'text': record.get('text', ''),
+                'document_id': document_id,
+                'chunk_index': record.get('chunk_index', 0),
+                'start_char': record.get('start_char'),
+                'end_char': record.get('end_char')
+            }
+            for score, document_id, record in candidates[:top_k]
+        ]
+
+    def _all_document_ids(self) -> List[str]:
+        return [
+            base64.urlsafe_b64decode(path.stem + "=" * (-len(path.stem) % 4)).decode("utf-8")
+            for path in self.index_dir.glob("*.json")
+        ]
+
+    async def list_chunk_ids(self, document_id: str) -> Set[str]:
+        partition = await asyncio.to_thread(self._load_partition, document_id)
+        return {record['id'] for record in partition[1]} if partition else set()
+
+    async def delete_chunks(self, document_id: str, chunk_ids: List[str]):
+        await asyncio.to_thread(self._delete_chunks, document_id, chunk_ids)
+
+    def _delete_chunks(self, document_id: str, chunk_ids: List[str]):
+        with self._write_lock(document_id):
+            partition = self._load_partition(document_id)
+            if partition is None:
+                return
+            removed = set(chunk_ids)
+            keep = [i for i, record in enumerate(partition[1]) if record['id'] not in removed]
+            if len(keep) == len(partition[1]):
+                return
+            if not keep:
+                self._delete_partition(document_id)
+                return
+            self._write_partition(document_id, np.array(partition[0][keep]), [partition[1][i] for i in keep])
+
     async def delete_document_chunks(self, document_id: str):
-        self.index.delete(filter={"document_id": document_id})
\ No newline at end of file
+        await asyncio.to_thread(self._delete_partition, document_id)
+
+    def _delete_partition(self, document_id: str):
+        self._records_path(document_id).unlink(missing_ok=True)
+        self._invalidate(document_id)
+        for path in self._matrix_paths(document_id):
+            path.unlink(missing_ok=True)
+
+
+def create_vector_store(backend: str) -> VectorStore:
+    if backend == "pinecone":
+        return PineconeVectorStore()
+    if backend == "local":
+        return LocalVectorStore()
+    raise ValueError(f"Unknown vector store backend: {backend}")